@@ -3,14 +3,28 @@
 
 import os
 import sqlite3
-from flask import Flask, request, render_template_string, url_for,redirect
-import pandas as pd
-import plotly.graph_objs as go
-import plotly.io as pio
+from flask import Flask, Blueprint, current_app, request, render_template, url_for, redirect
+from jinja2 import DictLoader
 from werkzeug.utils import secure_filename
 import uuid
-from datetime import datetime, timedelta
-from flask import make_response
+import shutil
+import zipfile
+import io
+import zlib
+import json
+import multiprocessing
+import pickle
+import tempfile
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import click
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import groupby
+from operator import itemgetter
+from datetime import datetime
+from flask import make_response, jsonify, Response, stream_with_context, g, has_request_context
 
 
 # -------------------------
@@ -18,19 +32,68 @@ from flask import make_response
 # -------------------------
 
 
-app = Flask(__name__)
-
+# Heavy libraries (pandas, numpy, plotly) are imported inside the functions
+# that need them, so workers and CLI commands start without paying for them.
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_NAME = os.path.join(BASE_DIR, 'gps_data.db')
-
-
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# create_app() defaults; override with a mapping or the file named by $ASSET_TRACKER_SETTINGS
+DEFAULT_CONFIG = {
+    'DATABASE': DB_NAME,
+    'UPLOAD_FOLDER': UPLOAD_FOLDER,
+    'JOBS_FOLDER': None,  # defaults to UPLOAD_FOLDER/jobs
+    'MAX_CONTENT_LENGTH': 100 * 1024 * 1024,
+    # Streaming ingest: rows parsed per chunk / rows per write transaction
+    'IMPORT_CHUNK_SIZE': 50_000,
+    'IMPORT_COMMIT_ROWS': 200_000,
+    # Add a Server-Timing header with the per-stage breakdown (visible in devtools)
+    'SERVER_TIMING': False,
+    # Processes parsing the files of a batch upload (None = one per core)
+    'IMPORT_PARSE_WORKERS': None,
+    # Tracker uploads: plain CSV, gzipped CSV, or a zip of CSVs
+    'UPLOAD_EXTENSIONS': ('csv', 'gz', 'zip'),
+    # Raw ping reads: 'sqlite' (gps_data) or 'parquet' (month/device-bucket files, needs pyarrow)
+    'STORAGE_BACKEND': 'sqlite',
+    'PARQUET_ROOT': os.path.join(BASE_DIR, 'parquet'),
+    'PARQUET_DEVICE_BUCKETS': 16,
+    'PARQUET_ROW_GROUP_ROWS': 64 * 1024,
+    # Fleet report: devices per worker task / worker processes (None = one per core)
+    'FLEET_BATCH_SIZE': 32,
+    'FLEET_WORKERS': None,
+    # Rows fetched per export batch (CSV chunk / Parquet row group)
+    'EXPORT_BATCH_ROWS': 50_000,
+    # SQLite connection pragmas (see connect_db)
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_CACHE_SIZE': -64 * 1024,  # KiB when negative -> 64 MB
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+    'SQLITE_TEMP_STORE': 'MEMORY',
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    # Voltage trace point budget ('lttb' or 'minmax'); ?points= may lower it and ?downsample=
+    # pick the method per request
+    'CHART_MAX_POINTS': 2000,
+    'CHART_DOWNSAMPLE': 'lttb',
+    # In-process LRU cache of /tracker results + chart HTML
+    'RESULT_CACHE_BYTES': 64 * 1024 * 1024,
+    # Most points one /api/devices/<id>/series response may return
+    'SERIES_MAX_POINTS': 100_000,
+    # Most devices one /tracker/compare chart may overlay
+    'COMPARE_MAX_DEVICES': 20,
+    # Retention tiers (see run_retention): raw pings older than RETENTION_RAW_DAYS are rolled
+    # into hourly aggregates, hourly rows older than RETENTION_HOURLY_DAYS into daily ones
+    'RETENTION_RAW_DAYS': 90,
+    'RETENTION_HOURLY_DAYS': 730,
+    # Source rows aggregated and deleted per retention transaction
+    'RETENTION_BATCH_ROWS': 50_000,
+    # Run retention every N hours in a background thread (None = only via `flask retention`)
+    'RETENTION_INTERVAL_HOURS': None,
+    # Fleet status: silent this long counts as offline / last voltage below this counts as low
+    'STATUS_OFFLINE_HOURS': 24,
+    'STATUS_LOW_VOLTAGE': 3.5,
+}
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024
+bp = Blueprint('main', __name__, cli_group=None)
 
 
 # -------------------------
@@ -170,8 +233,9 @@ TRACKER_TEMPLATE = """
 
       <input type="hidden" name="form_type" value="upload">
         <div class="mb-3">
-          <label class="form-label">Upload CSV File</label>
-          <input class="form-control" type="file" name="file" accept=".csv" required>
+          <label class="form-label">Upload CSV Files</label>
+          <input class="form-control" type="file" name="file" accept=".csv,.gz,.zip" multiple required>
+          <div class="form-text">Select several daily exports or a .zip/.gz archive to import them in one batch.</div>
         </div>
         <div class="mb-3">
           <label class="form-label">Date Format in File:</label>
@@ -193,6 +257,32 @@ TRACKER_TEMPLATE = """
     <div class="alert alert-success">✅ File uploaded and data imported successfully.</div>
   {% endif %}
 
+  {% if job_id %}
+    <div class="alert alert-info" id="job-status" data-url="{{ url_for('.tracker_job', job_id=job_id) }}">
+      ⏳ File uploaded, import queued (job <a href="{{ url_for('.tracker_job', job_id=job_id) }}">{{ job_id }}</a>).
+    </div>
+    <script>
+      (function poll() {
+        const box = document.getElementById('job-status');
+        fetch(box.dataset.url).then(r => r.json()).then(job => {
+          if (job.phase === 'done' && job.devices) {
+            box.className = 'alert alert-success';
+            box.textContent = `✅ Device info updated: ${job.devices.inserted} new, ${job.devices.updated} changed, ${job.devices.unchanged} unchanged.`;
+          } else if (job.phase === 'done') {
+            box.className = 'alert alert-success';
+            box.textContent = `✅ Import finished: ${job.rows_written} new rows, ${job.rows_duplicate} duplicates, ${job.rows_expired} past retention, ${job.rows_dropped} dropped (${job.rows_bad_timestamp} with unreadable dates).`;
+          } else if (job.phase === 'failed') {
+            box.className = 'alert alert-danger';
+            box.textContent = `Upload failed: ${job.error}`;
+          } else {
+            box.textContent = `⏳ Import ${job.phase}: ${job.rows_read} rows read (${Math.round(job.rows_per_sec)} rows/s)`;
+            setTimeout(poll, 2000);
+          }
+        });
+      })();
+    </script>
+  {% endif %}
+
   <div class="card mb-4">
     <div class="card-header">Device Search</div>
     <div class="card-body">
@@ -218,6 +308,89 @@ TRACKER_TEMPLATE = """
     </div>
   </div>
 
+  <div class="card mb-4">
+    <div class="card-header">Compare Devices</div>
+    <div class="card-body">
+      <form method="get" action="/tracker/compare">
+        <div class="mb-3">
+          <label class="form-label">Device IDs</label>
+          <input type="text" class="form-control" name="devices" placeholder="DEV1,DEV2,DEV3" value="{{ compare_prefill or '' }}">
+          <div class="form-text">Comma separated, or leave empty and pick a branch to compare all of its devices.</div>
+        </div>
+        <div class="row">
+          <div class="col-md-6 mb-3">
+            <label class="form-label">Region</label>
+            <input type="text" class="form-control" name="region" value="{{ region_prefill or '' }}">
+          </div>
+          <div class="col-md-6 mb-3">
+            <label class="form-label">Branch</label>
+            <input type="text" class="form-control" name="branch" value="{{ branch_prefill or '' }}">
+          </div>
+        </div>
+        <div class="row">
+          <div class="col-md-6 mb-3">
+            <label class="form-label">From Date</label>
+            <input type="text" class="form-control datepicker" name="from_date" placeholder="dd/mm/yyyy" required>
+          </div>
+          <div class="col-md-6 mb-3">
+            <label class="form-label">To Date</label>
+            <input type="text" class="form-control datepicker" name="to_date" placeholder="dd/mm/yyyy" required>
+          </div>
+        </div>
+        <button class="btn btn-success" type="submit">Compare</button>
+      </form>
+    </div>
+  </div>
+
+  {% if compare_error %}
+    <div class="alert alert-warning">{{ compare_error }}</div>
+  {% endif %}
+
+  {% if comparison %}
+    <div class="card mb-4">
+      <div class="card-header">
+        Comparison{% if comparison['branch'] %} &mdash; branch {{ comparison['branch'] }}{% endif %}
+        ({{ comparison['from_date'] }} to {{ comparison['to_date'] }})
+      </div>
+      <div class="card-body">
+        <div class="table-responsive">
+          <table class="table table-striped">
+            <thead>
+              <tr>
+                <th>Device</th>
+                <th>Region</th>
+                <th>Branch</th>
+                <th>Total Pings</th>
+                <th>Total Charges</th>
+                <th>Status</th>
+              </tr>
+            </thead>
+            <tbody>
+              {% for row in comparison['devices'] %}
+              <tr>
+                <td><a href="{{ url_for('.tracker', device=row['device'], from_date=comparison['from_date'], to_date=comparison['to_date']) }}">{{ row['device'] }}</a></td>
+                <td>{{ row['region'] or '' }}</td>
+                <td>{{ row['branch'] or '' }}</td>
+                <td>{{ row['pings'] }}</td>
+                <td>{{ row['charges'] }}</td>
+                <td>
+                  {% if not row['rows'] %}
+                    <span class="badge bg-secondary">No data</span>
+                  {% elif row['long_offline_count'] > 0 %}
+                    <span class="badge bg-warning text-dark">{{ row['long_offline_count'] }} long offline period(s)</span>
+                  {% else %}
+                    <span class="badge bg-success">Normal</span>
+                  {% endif %}
+                </td>
+              </tr>
+              {% endfor %}
+            </tbody>
+          </table>
+        </div>
+      </div>
+    </div>
+  {% endif %}
+
   {% if result %}
     <div class="card mb-4">
       <div class="card-header">Results</div>
@@ -441,13 +614,18 @@ REGION_TEMPLATE = """
               <label class="form-label">Upload Region Data File</label>
               <input class="form-control" type="file" name="file" accept=".csv" required>
             </div>
+            <div class="form-check mb-3">
+              <input class="form-check-input" type="checkbox" name="deactivate_missing" id="deactivate_missing">
+              <label class="form-check-label" for="deactivate_missing">Deactivate devices missing from this file</label>
+            </div>
             <button class="btn btn-primary" type="submit">Upload</button>
           </form>
         </div>
       </div>
 
       {% if upload_success %}
-        <div class="alert alert-success">✅ File uploaded and device info imported successfully.</div>
+        <div class="alert alert-success">✅ File uploaded and device info imported successfully:
+          {{ upload_counts.inserted }} new, {{ upload_counts.updated }} changed, {{ upload_counts.unchanged }} unchanged{% if upload_counts.deactivated %}, {{ upload_counts.deactivated }} deactivated{% endif %}.</div>
       {% endif %}
 
       <!-- Device Filter Card -->
@@ -464,7 +642,7 @@ REGION_TEMPLATE = """
           <div class="mb-3">
             <div id="branch-count" class="fw-bold text-primary mb-2"></div>
             <label class="form-label">Select Branch</label>
-            <select class="form-select" id="branch-select" onchange="updateDevices()">
+            <select class="form-select" id="branch-select" onchange="updateDevices(1)">
               <option value="">-- Select Branch --</option>
             </select>
           </div>
@@ -480,18 +658,23 @@ REGION_TEMPLATE = """
 </div>
 
 <script>
-  const data = {{ data|tojson }};
   const regionSelect = document.getElementById('region-select');
   const branchSelect = document.getElementById('branch-select');
   const deviceList = document.getElementById('device-list');
+  const PER_PAGE = 100;
+
+  function getJSON(url, params) {
+    return fetch(url + '?' + new URLSearchParams(params)).then(r => r.json());
+  }
 
   // Initialize regions
-  const regions = [...new Set(data.map(item => item.region))].filter(r => r);
-  regions.forEach(region => {
-    const option = document.createElement('option');
-    option.value = region;
-    option.text = region;
-    regionSelect.appendChild(option);
+  getJSON('/api/regions', {}).then(regions => {
+    regions.forEach(item => {
+      const option = document.createElement('option');
+      option.value = item.region;
+      option.text = item.region;
+      regionSelect.appendChild(option);
+    });
   });
 
   function updateBranches() {
@@ -502,95 +685,848 @@ REGION_TEMPLATE = """
     const selectedRegion = regionSelect.value;
     if (!selectedRegion) return;
 
-    const branches = [...new Set(data
-      .filter(item => item.region === selectedRegion && item.branch)
-      .map(item => item.branch))];
+    getJSON('/api/branches', {region: selectedRegion}).then(branches => {
+      if (regionSelect.value !== selectedRegion) return;
+      branches.forEach(item => {
+        const option = document.createElement('option');
+        option.value = item.branch;
+        option.text = item.branch;
+        branchSelect.appendChild(option);
+      });
 
-    branches.forEach(branch => {
-      const option = document.createElement('option');
-      option.value = branch;
-      option.text = branch;
-      branchSelect.appendChild(option);
+      document.getElementById('branch-count').textContent =
+        `${branches.length} ${branches.length === 1 ? 'branch' : 'branches'} found`;
     });
-
-    document.getElementById('branch-count').textContent =
-      `${branches.length} ${branches.length === 1 ? 'branch' : 'branches'} found`;
   }
 
-  function updateDevices() {
-    deviceList.innerHTML = '';
+  function updateDevices(page) {
+    page = page || 1;
+    if (page === 1) deviceList.innerHTML = '';
     const selectedRegion = regionSelect.value;
     const selectedBranch = branchSelect.value;
-   
+
     if (!selectedRegion || !selectedBranch) return;
 
-    const filtered = data.filter(item =>
-      item.region === selectedRegion &&
-      item.branch === selectedBranch &&
-      item.device
-    );
-
-    if (filtered.length === 0) {
-      const li = document.createElement('li');
-      li.className = 'list-group-item text-muted';
-      li.textContent = 'No devices found.';
-      deviceList.appendChild(li);
-    } else {
-      filtered.forEach(item => {
+    const params = {region: selectedRegion, branch: selectedBranch, page: page, per_page: PER_PAGE};
+    getJSON('/api/devices', params).then(result => {
+      if (branchSelect.value !== selectedBranch) return;
+      const more = document.getElementById('more-devices');
+      if (more) more.remove();
+
+      if (result.total === 0) {
+        const li = document.createElement('li');
+        li.className = 'list-group-item text-muted';
+        li.textContent = 'No devices found.';
+        deviceList.appendChild(li);
+        return;
+      }
+
+      result.devices.forEach(item => {
         const li = document.createElement('li');
         li.className = 'list-group-item d-flex justify-content-between align-items-center';
-        li.innerHTML = `
-          <a href="/tracker?device=${encodeURIComponent(item.device)}" class="text-decoration-none">${item.device}</a>
-          <span class="badge bg-secondary">${item.sim_type || 'N/A'}</span>
-        `;
+        const link = document.createElement('a');
+        link.href = `/tracker?device=${encodeURIComponent(item.device)}`;
+        link.className = 'text-decoration-none';
+        link.textContent = item.device;
+        const badge = document.createElement('span');
+        badge.className = 'badge bg-secondary';
+        badge.textContent = item.sim_type || 'N/A';
+        li.append(link, badge);
         deviceList.appendChild(li);
       });
-    }
+
+      if (page * result.per_page < result.total) {
+        const li = document.createElement('li');
+        li.id = 'more-devices';
+        li.className = 'list-group-item text-center';
+        const button = document.createElement('button');
+        button.className = 'btn btn-sm btn-outline-secondary';
+        button.textContent = `Show more (${result.total - page * result.per_page} left)`;
+        button.onclick = () => updateDevices(page + 1);
+        li.appendChild(button);
+        deviceList.appendChild(li);
+      }
+    });
   }
 </script>
 </body>
 </html>"""
 
+# Registered on the app's Jinja loader so each template is compiled only once
+TEMPLATES = {
+    'landing.html': LANDING_TEMPLATE,
+    'tracker.html': TRACKER_TEMPLATE,
+    'region.html': REGION_TEMPLATE,
+}
+
 # -------------------------
 # DB helpers
 # -------------------------
-def create_tables():
-    """Create required tables if they don't exist (safe to call at startup)."""
-    with sqlite3.connect(DB_NAME) as conn:
-        c = conn.cursor()
-        # device_info table
+_db_local = threading.local()
+
+
+def connect_db(readonly=False, db_name=None):
+    """Open a tuned connection: WAL journal plus the SQLITE_* pragmas from the app config."""
+    db_name = db_name or current_app.config['DATABASE']
+    if readonly:
+        conn = sqlite3.connect(f'file:{db_name}?mode=ro', uri=True)
+    else:
+        # BEGIN IMMEDIATE: a writer takes the write lock before it reads, so a second
+        # writer waits out busy_timeout instead of failing to upgrade a read transaction
+        conn = sqlite3.connect(db_name, isolation_level='IMMEDIATE')
+        # takes effect on a new file (or at the next VACUUM) so retention can hand pages back;
+        # it has to come before the journal mode writes the header
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        # WAL lets readers keep going while an import holds the write lock
+        conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute(f"PRAGMA busy_timeout = {int(current_app.config['SQLITE_BUSY_TIMEOUT_MS'])}")
+    conn.execute(f"PRAGMA synchronous = {current_app.config['SQLITE_SYNCHRONOUS']}")
+    conn.execute(f"PRAGMA cache_size = {int(current_app.config['SQLITE_CACHE_SIZE'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(current_app.config['SQLITE_MMAP_SIZE'])}")
+    conn.execute(f"PRAGMA temp_store = {current_app.config['SQLITE_TEMP_STORE']}")
+    return conn
+
+
+def get_db(readonly=False):
+    """Pooled per-thread connection shared by routes and importers.
+
+    Connections are reused for the life of the thread (and reopened after a
+    fork). Use ``with get_db() as conn:`` for a transaction; it is not closed.
+    Query routes should pass ``readonly=True``.
+    """
+    if getattr(_db_local, 'pid', None) != os.getpid():
+        _db_local.pid = os.getpid()
+        _db_local.pool = {}
+    key = (current_app.config['DATABASE'], readonly)
+    conn = _db_local.pool.get(key)
+    if conn is None:
+        conn = _db_local.pool[key] = connect_db(readonly)
+    return conn
+
+
+def close_db():
+    """Close this thread's pooled connections."""
+    for conn in getattr(_db_local, 'pool', {}).values():
+        conn.close()
+    _db_local.pool = {}
+
+SCHEMA_VERSION = 11
+
+def to_epoch(values):
+    """Datetime Series -> int64 epoch seconds (naive timestamps taken as-is)."""
+    import pandas as pd
+    return ((values - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).astype('int64')
+
+
+def from_epoch(values):
+    """Epoch seconds -> naive datetime Series."""
+    import pandas as pd
+    return pd.to_datetime(values, unit='s')
+
+
+def epoch_seconds(ts):
+    """Single timestamp (or parseable string) -> epoch seconds."""
+    import pandas as pd
+    return int((pd.Timestamp(ts) - pd.Timestamp(0)) // pd.Timedelta(seconds=1))
+
+
+# Gps frames read back from storage: categorical device/event, float32 voltage,
+# int64 epoch (datetime64 once converted). Import chunks keep float64 voltages
+# so stored values are never truncated. float32 keeps ~7 significant digits,
+# so read voltages are rounded back to VOLTAGE_DECIMALS before threshold maths.
+VOLTAGE_DECIMALS = 5
+GPS_DTYPES = {'tracking_date': 'int64', 'battery_voltage': 'float32'}
+GPS_CATEGORIES = ('device', 'event')
+
+
+def compact_gps_frame(df):
+    """Cast gps columns of ``df`` to the compact dtypes (in place; returns ``df``)."""
+    for column in GPS_CATEGORIES:
+        if column in df and df[column].dtype != 'category':
+            df[column] = df[column].astype('category')
+    if 'battery_voltage' in df:
+        df['battery_voltage'] = df['battery_voltage'].astype('float32')
+    return df
+
+
+def gps_frame(rows, columns):
+    """Build a compact frame from an iterable of row tuples (e.g. a cursor).
+
+    Numeric columns stream straight into typed arrays, so no per-row Python
+    objects are kept while reading.
+    """
+    import numpy as np
+    import pandas as pd
+    columns = list(columns)
+    if all(column in GPS_DTYPES for column in columns):
+        data = np.fromiter(rows, dtype=[(column, GPS_DTYPES[column]) for column in columns])
+        return pd.DataFrame({column: data[column] for column in columns})
+    return compact_gps_frame(pd.DataFrame.from_records(list(rows), columns=columns))
+
+
+def stored_voltages(values):
+    """float32 voltages -> the float64 values they were read from."""
+    return values.astype('float64').round(VOLTAGE_DECIMALS)
+
+
+def now_epoch():
+    """The local wall-clock time now, in the same epoch seconds as tracking_date."""
+    return int((datetime.now() - datetime(1970, 1, 1)).total_seconds())
+
+
+# CREATE statements per table for the current schema version
+SCHEMA = {
+    'device_info': [
+        '''
+        CREATE TABLE IF NOT EXISTS device_info (
+            device TEXT PRIMARY KEY,
+            region TEXT,
+            branch TEXT,
+            sim_type TEXT,
+            active INTEGER NOT NULL DEFAULT 1
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_region ON device_info(region)',
+        'CREATE INDEX IF NOT EXISTS idx_branch ON device_info(branch)',
+    ],
+    # tracking_date is stored as integer epoch seconds (schema v2+)
+    'gps_data': [
+        '''
+        CREATE TABLE IF NOT EXISTS gps_data (
+            sl_no INTEGER,
+            device TEXT,
+            event TEXT,
+            tracking_date INTEGER,
+            battery_voltage REAL
+        )
+        ''',
+        # natural key; its (device, tracking_date) prefix also serves range lookups
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_gps_natural
+        ON gps_data(device, tracking_date, event, sl_no)
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_date ON gps_data(tracking_date)',
+    ],
+    # charge cycles materialized at ingest (see refresh_charge_events)
+    'charge_events': [
+        '''
+        CREATE TABLE IF NOT EXISTS charge_events (
+            device TEXT NOT NULL,
+            start_time INTEGER NOT NULL,
+            end_time INTEGER NOT NULL,
+            start_voltage REAL,
+            max_voltage REAL,
+            PRIMARY KEY (device, start_time)
+        )
+        ''',
+    ],
+    # per-device daily event counts maintained by write_gps_chunk
+    'daily_ping_counts': [
+        '''
+        CREATE TABLE IF NOT EXISTS daily_ping_counts (
+            device TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (device, day, event)
+        )
+        ''',
+    ],
+    # latest row and running PING_EVENTS count per device, maintained by write_gps_chunk
+    'device_status': [
+        '''
+        CREATE TABLE IF NOT EXISTS device_status (
+            device TEXT PRIMARY KEY,
+            last_seen INTEGER NOT NULL,
+            last_voltage REAL,
+            last_event TEXT,
+            ping_count INTEGER NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_status_last_seen ON device_status(last_seen)',
+    ],
+    # bumped by every import touching a device; part of the result cache key
+    'data_versions': [
+        '''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            device TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+        ''',
+    ],
+    # catalog of the optional Parquet store (paths relative to PARQUET_ROOT)
+    'parquet_files': [
+        '''
+        CREATE TABLE IF NOT EXISTS parquet_files (
+            path TEXT PRIMARY KEY,
+            month TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            min_ts INTEGER NOT NULL,
+            max_ts INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            min_device TEXT NOT NULL,
+            max_device TEXT NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_parquet_bucket ON parquet_files(bucket, min_ts, max_ts)',
+    ],
+    # voltage aggregates of pings past raw retention (see run_retention); avg = sum / count
+    'gps_hourly': [
+        '''
+        CREATE TABLE IF NOT EXISTS gps_hourly (
+            device TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            min_voltage REAL,
+            max_voltage REAL,
+            sum_voltage REAL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (device, hour)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_hourly_hour ON gps_hourly(hour)',
+    ],
+    'gps_daily': [
+        '''
+        CREATE TABLE IF NOT EXISTS gps_daily (
+            device TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            min_voltage REAL,
+            max_voltage REAL,
+            sum_voltage REAL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (device, day)
+        )
+        ''',
+    ],
+    # tier -> epoch before which that tier has been rolled into the next coarser one
+    'retention_state': [
+        '''
+        CREATE TABLE IF NOT EXISTS retention_state (
+            tier TEXT PRIMARY KEY,
+            rolled_before INTEGER NOT NULL
+        )
+        ''',
+    ],
+}
+
+
+def table_exists(c, name):
+    return c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def _create_schema(c, *tables):
+    """Create ``tables`` (default: all) at the current schema version."""
+    for table in tables or SCHEMA:
+        for statement in SCHEMA[table]:
+            c.execute(statement)
+
+
+def _migrate_v2(c):
+    """TEXT tracking_date -> integer epoch seconds; composite device/date index."""
+    c.execute('DROP INDEX IF EXISTS idx_device')
+    c.execute('DROP INDEX IF EXISTS idx_date')
+    c.execute('ALTER TABLE gps_data RENAME TO gps_data_v1')
+    c.execute('''
+        CREATE TABLE gps_data (
+            sl_no INTEGER,
+            device TEXT,
+            event TEXT,
+            tracking_date INTEGER,
+            battery_voltage REAL
+        )
+    ''')
+    c.execute('''
+        INSERT INTO gps_data (sl_no, device, event, tracking_date, battery_voltage)
+        SELECT sl_no, device, event,
+               CASE WHEN typeof(tracking_date) = 'text'
+                    THEN CAST(strftime('%s', tracking_date) AS INTEGER)
+                    ELSE tracking_date END,
+               battery_voltage
+        FROM gps_data_v1
+    ''')
+    c.execute('DROP TABLE gps_data_v1')
+    c.execute('CREATE INDEX idx_device_date ON gps_data(device, tracking_date)')
+    c.execute('CREATE INDEX idx_date ON gps_data(tracking_date)')
+
+
+def _migrate_v3(c):
+    """Backfill charge_events for every device already in gps_data."""
+    _create_schema(c, 'charge_events')
+    rebuild_charge_events(c)
+
+
+def _migrate_v4(c):
+    """Backfill the daily_ping_counts rollup from gps_data."""
+    _create_schema(c, 'daily_ping_counts')
+    rebuild_daily_pings(c)
+
+
+def _migrate_v6(c):
+    """Drop duplicate rows, then enforce the (device, tracking_date, event, sl_no) key."""
+    dedupe_gps_data(c)
+    c.execute('DROP INDEX IF EXISTS idx_device_date')
+    _create_schema(c, 'gps_data')
+
+
+def _migrate_v8(c):
+    """Rebuild device_info with its primary key, lookup indexes and an ``active`` flag.
+
+    Older uploads replaced the table through pandas, dropping the key and
+    indexes (and storing numeric ids as REAL); repeated devices keep their
+    last row.
+    """
+    c.execute('''
+        CREATE TABLE device_info_v8 (
+            device TEXT PRIMARY KEY,
+            region TEXT,
+            branch TEXT,
+            sim_type TEXT,
+            active INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    if c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'device_info'").fetchone():
         c.execute('''
-            CREATE TABLE IF NOT EXISTS device_info (
-                device TEXT PRIMARY KEY,
-                region TEXT,
-                branch TEXT,
-                sim_type TEXT
-            )
+            INSERT OR REPLACE INTO device_info_v8 (device, region, branch, sim_type)
+            SELECT CASE WHEN typeof(device) = 'real' AND device = CAST(device AS INTEGER)
+                        THEN CAST(CAST(device AS INTEGER) AS TEXT) ELSE device END,
+                   region, branch, sim_type
+            FROM device_info
+            WHERE device IS NOT NULL
+            ORDER BY rowid
         ''')
-        c.execute('CREATE INDEX IF NOT EXISTS idx_region ON device_info(region)')
-        c.execute('CREATE INDEX IF NOT EXISTS idx_branch ON device_info(branch)')
-        # gps_data table (do not DROP; just ensure existence)
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS gps_data (
-                sl_no INTEGER,
-                device TEXT,
-                event TEXT,
-                tracking_date TEXT,
-                battery_voltage REAL
+        c.execute('DROP TABLE device_info')
+    c.execute('ALTER TABLE device_info_v8 RENAME TO device_info')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_region ON device_info(region)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_branch ON device_info(branch)')
+
+
+def _migrate_v10(c):
+    """Backfill device_status from the stored pings."""
+    _create_schema(c, 'device_status')
+    rebuild_device_status(c)
+
+
+MIGRATIONS = {
+    2: _migrate_v2,
+    3: _migrate_v3,
+    4: _migrate_v4,
+    5: lambda c: _create_schema(c, 'data_versions'),
+    6: _migrate_v6,
+    7: lambda c: _create_schema(c, 'parquet_files'),
+    8: _migrate_v8,
+    9: lambda c: _create_schema(c, 'gps_hourly', 'gps_daily', 'retention_state'),
+    10: _migrate_v10,
+    # ping_count used to include every event, not just PING_EVENTS
+    11: lambda c: rebuild_device_status(c),
+}
+
+
+def rebuild_daily_pings(c):
+    c.execute('DELETE FROM daily_ping_counts')
+    c.execute('''
+        INSERT INTO daily_ping_counts (device, day, event, count)
+        SELECT device, tracking_date - tracking_date % 86400, event, COUNT(*)
+        FROM gps_data
+        WHERE tracking_date IS NOT NULL
+        GROUP BY 1, 2, 3
+    ''')
+
+
+def rebuild_device_status(c):
+    """Recompute device_status: PING_EVENTS counts from daily_ping_counts, the latest row from gps_data.
+
+    Devices whose raw rows have all been rolled up keep the day of their
+    last ping and no voltage.
+    """
+    c.execute('DELETE FROM device_status')
+    # with a lone MAX(), SQLite takes the bare columns from the row holding the maximum
+    c.execute(f'''
+        INSERT INTO device_status (device, last_seen, last_voltage, last_event, ping_count)
+        SELECT p.device, COALESCE(g.last_seen, p.last_day), g.battery_voltage, g.event, p.pings
+        FROM (
+            SELECT device, MAX(day) AS last_day,
+                   SUM(CASE WHEN event IN ({', '.join('?' * len(PING_EVENTS))}) THEN count ELSE 0 END) AS pings
+            FROM daily_ping_counts GROUP BY device
+        ) p
+        LEFT JOIN (
+            SELECT device, MAX(tracking_date) AS last_seen, battery_voltage, event
+            FROM gps_data WHERE tracking_date IS NOT NULL GROUP BY device
+        ) g ON g.device = p.device
+    ''', PING_EVENTS)
+
+
+def rebuild_charge_events(c):
+    devices = [row[0] for row in c.execute('SELECT DISTINCT device FROM gps_data')]
+    for device in devices:
+        refresh_charge_events(c, device)
+
+
+def dedupe_gps_data(c):
+    """Delete rows repeating an earlier row's natural key and rebuild derived tables.
+
+    Returns the number of rows removed. Does not commit.
+    """
+    before = c.total_changes
+    c.execute('''
+        DELETE FROM gps_data WHERE rowid NOT IN (
+            SELECT MIN(rowid) FROM gps_data
+            GROUP BY device, tracking_date, event, sl_no
+        )
+    ''')
+    removed = c.total_changes - before
+    if removed:
+        rebuild_daily_pings(c)
+        # the v6 migration dedupes before device_status exists (v10 backfills it)
+        if table_exists(c, 'device_status'):
+            rebuild_device_status(c)
+        rebuild_charge_events(c)
+        bump_data_version(c, [row[0] for row in c.execute('SELECT DISTINCT device FROM gps_data')])
+    return removed
+
+
+def create_tables():
+    """Create required tables and migrate older databases in place (safe to call at startup)."""
+    with get_db() as conn:
+        c = conn.cursor()
+        version = c.execute('PRAGMA user_version').fetchone()[0]
+        existing = c.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'gps_data'"
+        ).fetchone()
+
+        if existing:
+            # pre-versioning databases report user_version 0 and are v1
+            version = max(version, 1)
+            # each step runs in its own transaction and records its version
+            for target in range(version + 1, SCHEMA_VERSION + 1):
+                c.execute('BEGIN IMMEDIATE')
+                MIGRATIONS[target](conn)
+                c.execute(f'PRAGMA user_version = {target}')
+                conn.commit()
+                current_app.logger.info("Migrated %s to schema v%d", current_app.config['DATABASE'], target)
+
+        _create_schema(c)
+        c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+
+def bump_data_version(conn, devices):
+    """Invalidate cached results for ``devices`` (does not commit)."""
+    conn.executemany(
+        """
+        INSERT INTO data_versions (device, version) VALUES (?, 1)
+        ON CONFLICT(device) DO UPDATE SET version = version + 1
+        """,
+        [(device,) for device in devices]
+    )
+
+
+def data_version(conn, device):
+    row = conn.execute("SELECT version FROM data_versions WHERE device = ?", (device,)).fetchone()
+    return row[0] if row else 0
+
+
+def allowed_file(filename, extensions=('csv',)):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in extensions
+
+def read_gps_rows(conn, device, start=None, end=None, columns=('tracking_date', 'battery_voltage'),
+                  backend=None):
+    """``device``'s rows in [start, end] (epoch, open-ended if None) ordered by time.
+
+    Reads from the Parquet store when ``backend`` (default STORAGE_BACKEND)
+    is 'parquet'; migrations and derived tables pass 'sqlite' to read the
+    gps_data ledger, which exists before the Parquet catalog does and
+    is never behind it. tracking_date is returned as datetimes; see
+    compact_gps_frame for the other dtypes.
+    """
+    if (backend or current_app.config['STORAGE_BACKEND']) == 'parquet':
+        df = read_parquet_rows(conn, device, start, end, columns)
+    else:
+        clauses, params = ["device = ?", "tracking_date IS NOT NULL"], [device]
+        if start is not None:
+            clauses.append("tracking_date >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("tracking_date <= ?")
+            params.append(end)
+        df = gps_frame(conn.execute(
+            f"""
+            SELECT {', '.join(columns)} FROM gps_data
+            WHERE {' AND '.join(clauses)}
+            ORDER BY tracking_date
+            """,
+            params
+        ), columns)
+    compact_gps_frame(df)
+    if 'tracking_date' in df:
+        df['tracking_date'] = from_epoch(df['tracking_date'])
+    return df
+
+
+def iter_devices_rows(conn, devices, start, end, columns=('tracking_date', 'battery_voltage')):
+    """Yield ``(device, df)`` per device of ``devices`` with rows in [start, end], in device order.
+
+    The SQLite backend reads every device in one ``IN`` query walking the
+    (device, tracking_date) index and builds one frame per device as the
+    cursor reaches it; the Parquet backend reads device by device.
+    """
+    devices = sorted(set(devices))
+    if current_app.config['STORAGE_BACKEND'] == 'parquet':
+        frames = ((device, read_parquet_rows(conn, device, start, end, columns)) for device in devices)
+    else:
+        cursor = conn.execute(
+            f"""
+            SELECT device, {', '.join(columns)} FROM gps_data
+            WHERE device IN ({', '.join('?' * len(devices))})
+              AND tracking_date >= ? AND tracking_date <= ?
+            ORDER BY device, tracking_date
+            """,
+            (*devices, start, end)
+        )
+        frames = (
+            (device, gps_frame((row[1:] for row in rows), columns))
+            for device, rows in groupby(cursor, key=itemgetter(0))
+        )
+    for device, df in frames:
+        if df.empty:
+            continue
+        compact_gps_frame(df)
+        if 'tracking_date' in df:
+            df['tracking_date'] = from_epoch(df['tracking_date'])
+        yield device, df
+
+
+# bucket width in seconds per series resolution ('raw' is not bucketed)
+SERIES_RESOLUTIONS = {'raw': None, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def device_series(conn, device, start, end, resolution='hour', limit=None):
+    """Columnar voltage series for ``device`` over [start, end] (epoch).
+
+    'raw' returns every stored raw row as ``t``/``voltage``; other
+    resolutions group on the integer time bucket in SQL and return ``t``
+    (bucket start) with ``min``/``max``/``avg``/``count``, including the
+    hourly/daily retention tiers (no finer than the tier). At most ``limit``
+    points are read; returns None if the series would be longer.
+    """
+    width = SERIES_RESOLUTIONS[resolution]
+    if width is None:
+        columns = ('t', 'voltage')
+        sql = """
+            SELECT tracking_date, battery_voltage FROM gps_data
+            WHERE device = ? AND tracking_date >= ? AND tracking_date <= ?
+            ORDER BY tracking_date
+        """
+        params = [device, start, end]
+    else:
+        columns = ('t', 'min', 'max', 'avg', 'count')
+        # raw rows and the retention tiers never overlap, so they simply add up
+        sql = """
+            SELECT bucket, MIN(lo), MAX(hi), ROUND(SUM(total) / SUM(n), 4), SUM(n) FROM (
+                SELECT tracking_date - tracking_date % ? AS bucket, battery_voltage AS lo,
+                       battery_voltage AS hi, battery_voltage AS total, 1 AS n
+                FROM gps_data
+                WHERE device = ? AND tracking_date >= ? AND tracking_date <= ?
+                UNION ALL
+                SELECT hour - hour % ?, min_voltage, max_voltage, sum_voltage, count
+                FROM gps_hourly WHERE device = ? AND hour >= ? AND hour <= ?
+                UNION ALL
+                SELECT day - day % ?, min_voltage, max_voltage, sum_voltage, count
+                FROM gps_daily WHERE device = ? AND day >= ? AND day <= ?
             )
-        ''')
-        c.execute('CREATE INDEX IF NOT EXISTS idx_device ON gps_data(device)')
-        c.execute('CREATE INDEX IF NOT EXISTS idx_date ON gps_data(tracking_date)')
+            GROUP BY bucket
+            ORDER BY bucket
+        """
+        params = [width, device, start, end,
+                  max(width, 3600), device, start, end,
+                  max(width, 86400), device, start, end]
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    rows = conn.execute(sql, params).fetchall()
+    if limit is not None and len(rows) > limit:
+        return None
+    return {name: list(values) for name, values in zip(columns, zip(*rows))} if rows else \
+        {name: [] for name in columns}
+
+
+def read_voltage_history(conn, device, start, end):
+    """Voltage trace for ``device`` over [start, end] across the retention tiers.
+
+    Raw rows come from ``read_gps_rows``; ranges that have been rolled up
+    contribute one point per hour/day at the average voltage.
+    """
+    import pandas as pd
+    df = read_gps_rows(conn, device, start, end)
+
+    rolled = conn.execute(
+        """
+        SELECT hour, sum_voltage / count FROM gps_hourly
+        WHERE device = ? AND hour >= ? AND hour <= ?
+        UNION ALL
+        SELECT day, sum_voltage / count FROM gps_daily
+        WHERE device = ? AND day >= ? AND day <= ?
+        ORDER BY 1
+        """,
+        (device, start, end, device, start, end)
+    ).fetchall()
+    if not rolled:
+        return df
+    older = gps_frame(rolled, ['tracking_date', 'battery_voltage'])
+    older['tracking_date'] = from_epoch(older['tracking_date'])
+    return pd.concat([older, df], ignore_index=True).sort_values('tracking_date', kind='stable') \
+        .reset_index(drop=True)
+
+
+# -------------------------
+# Columnar (Parquet) storage
+# -------------------------
+# Optional mirror of gps_data as Parquet files partitioned by month and device
+# hash (STORAGE_BACKEND = 'parquet'). gps_data stays the ingest/dedup ledger;
+# the parquet_files catalog holds per-file min/max stats for pruning.
+
+def _parquet_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('sl_no', pa.int64()),
+        ('device', pa.string()),
+        ('event', pa.string()),
+        ('tracking_date', pa.int64()),
+        ('battery_voltage', pa.float64()),
+    ])
+
+
+def device_bucket(device):
+    return zlib.crc32(str(device).encode()) % current_app.config['PARQUET_DEVICE_BUCKETS']
+
+
+def _write_parquet_file(conn, month, bucket, table):
+    """Write one month/bucket file sorted by device and time, and catalog it on ``conn``."""
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    table = table.sort_by([('device', 'ascending'), ('tracking_date', 'ascending')])
+    rel_path = os.path.join(f'month={month}', f'bucket={bucket:03d}', f'part-{uuid.uuid4().hex}.parquet')
+    path = os.path.join(current_app.config['PARQUET_ROOT'], rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path, row_group_size=current_app.config['PARQUET_ROW_GROUP_ROWS'])
+    ts = pc.min_max(table['tracking_date'])
+    conn.execute(
+        "INSERT INTO parquet_files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (rel_path, month, int(bucket), ts['min'].as_py(), ts['max'].as_py(),
+         table.num_rows, table['device'][0].as_py(), table['device'][-1].as_py())
+    )
+
+
+def write_parquet_partitions(conn, df):
+    """Write gps rows (epoch tracking_date) as one file per month/bucket and catalog them on ``conn``."""
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+
+    if df.empty:
+        return 0
+    codes, uniques = pd.factorize(df['device'])
+    buckets = np.array([device_bucket(device) for device in uniques])[codes]
+    months = from_epoch(df['tracking_date']).dt.strftime('%Y-%m')
+    df = df.assign(sl_no=pd.to_numeric(df['sl_no'], errors='coerce').astype('Int64'))
+
+    schema = _parquet_schema()
+    written = 0
+    for (month, bucket), part in df.groupby([months, buckets]):
+        _write_parquet_file(conn, month, bucket,
+                            pa.Table.from_pandas(part[GPS_COLUMNS], schema=schema, preserve_index=False))
+        written += len(part)
+    return written
+
+
+def compact_parquet(conn, min_files=2):
+    """Rewrite each month/bucket partition that has ``min_files`` or more files as a single file.
+
+    Every import chunk adds a file per partition it touches, so without this
+    reads open more and more small files. Commits per partition; returns the
+    number of files removed.
+    """
+    import pyarrow.dataset as ds
+
+    root = current_app.config['PARQUET_ROOT']
+    partitions = conn.execute(
+        "SELECT month, bucket FROM parquet_files GROUP BY month, bucket HAVING COUNT(*) >= ?",
+        (min_files,)
+    ).fetchall()
+    removed = 0
+    for month, bucket in partitions:
+        paths = [path for (path,) in conn.execute(
+            "SELECT path FROM parquet_files WHERE month = ? AND bucket = ?", (month, bucket)
+        )]
+        table = ds.dataset([os.path.join(root, path) for path in paths],
+                           schema=_parquet_schema(), format='parquet').to_table()
+        _write_parquet_file(conn, month, bucket, table)
+        conn.executemany("DELETE FROM parquet_files WHERE path = ?", [(path,) for path in paths])
         conn.commit()
+        for path in paths:
+            try:
+                os.remove(os.path.join(root, path))
+            except FileNotFoundError:
+                pass
+        removed += len(paths)
+    return removed
+
+
+def read_parquet_rows(conn, device, start=None, end=None, columns=('tracking_date', 'battery_voltage')):
+    """Read ``columns`` for one device, pruning files by catalog stats and row groups by filter."""
+    import pandas as pd
+    import pyarrow.dataset as ds
+
+    # files only hold whole months, so they may still have rows rolled up out of gps_data
+    lo = max(start if start is not None else -2 ** 63, raw_horizon(conn))
+    hi = end if end is not None else 2 ** 63 - 1
+    paths = [
+        os.path.join(current_app.config['PARQUET_ROOT'], path)
+        for (path,) in conn.execute(
+            """
+            SELECT path FROM parquet_files
+            WHERE bucket = ? AND max_ts >= ? AND min_ts <= ?
+              AND min_device <= ? AND max_device >= ?
+            """,
+            (device_bucket(device), lo, hi, device, device)
+        )
+    ]
+    if not paths:
+        return pd.DataFrame(columns=list(columns))
+
+    expr = (ds.field('device') == device) & (ds.field('tracking_date') >= lo) & (ds.field('tracking_date') <= hi)
+    table = ds.dataset(paths, schema=_parquet_schema(), format='parquet').to_table(columns=list(columns), filter=expr)
+    return table.to_pandas().sort_values('tracking_date', kind='stable').reset_index(drop=True)
+
+
+def backfill_parquet(conn):
+    """Mirror all of gps_data into the Parquet store (replacing its catalog). Commits per batch."""
+    import pandas as pd
+    conn.execute("DELETE FROM parquet_files")
+    conn.commit()
+    written = 0
+    for batch in pd.read_sql_query(f"SELECT {', '.join(GPS_COLUMNS)} FROM gps_data", conn,
+                                   chunksize=current_app.config['IMPORT_COMMIT_ROWS']):
+        written += write_parquet_partitions(conn, batch)
+        conn.commit()
+    compact_parquet(conn)
+    return written
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'csv'
 
 # -------------------------
 # CSV importers
 # -------------------------
-def import_device_info(file_path):
-    df = pd.read_csv(file_path)
+def import_device_info(file_path, deactivate_missing=False):
+    """Upsert a device metadata CSV into device_info in one transaction.
+
+    New devices are inserted and rows whose region, branch or sim type
+    changed are updated in place; identical rows are not touched. With
+    ``deactivate_missing`` devices absent from the file are marked inactive
+    (hidden from the region search and fleet reports) rather than deleted.
+    Returns counts of inserted, updated, unchanged and deactivated devices.
+    """
+    import pandas as pd
+    df = pd.read_csv(file_path, dtype=str)
     df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
     required = ['device_id', 'region', 'branch', 'sim_type']
     missing = [col for col in required if col not in df.columns]
@@ -599,16 +1535,65 @@ def import_device_info(file_path):
 
     df = df[required].copy()
     df.rename(columns={'device_id': 'device'}, inplace=True)
+    df['device'] = df['device'].str.strip()
     df.dropna(subset=['device'], inplace=True)
-    # Write to DB (replace existing device_info table content)
-    with sqlite3.connect(DB_NAME) as conn:
-        df.to_sql('device_info', conn, if_exists='replace', index=False)
+    # the last row wins when a device is listed twice
+    df.drop_duplicates(subset=['device'], keep='last', inplace=True)
+    df = df.astype(object).where(df.notna(), None)
 
-def import_csv(file_path, date_format='mmddyyyy'):
-    df = pd.read_csv(file_path, low_memory=False)
-    df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
+    create_tables()
+    with get_db() as conn:
+        conn.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS device_stage (
+                device TEXT PRIMARY KEY, region TEXT, branch TEXT, sim_type TEXT
+            )
+        ''')
+        conn.execute('DELETE FROM device_stage')
+        conn.executemany('INSERT INTO device_stage VALUES (?, ?, ?, ?)',
+                         df.itertuples(index=False, name=None))
+
+        inserted = [row[0] for row in conn.execute('''
+            SELECT device FROM device_stage s
+            WHERE NOT EXISTS (SELECT 1 FROM device_info d WHERE d.device = s.device)
+        ''')]
+        updated = [row[0] for row in conn.execute('''
+            SELECT s.device FROM device_stage s JOIN device_info d ON d.device = s.device
+            WHERE d.region IS NOT s.region OR d.branch IS NOT s.branch
+               OR d.sim_type IS NOT s.sim_type OR d.active = 0
+        ''')]
+        conn.execute('''
+            INSERT INTO device_info (device, region, branch, sim_type, active)
+            SELECT device, region, branch, sim_type, 1 FROM device_stage WHERE true
+            ON CONFLICT(device) DO UPDATE SET
+                region = excluded.region, branch = excluded.branch,
+                sim_type = excluded.sim_type, active = 1
+            WHERE device_info.region IS NOT excluded.region
+               OR device_info.branch IS NOT excluded.branch
+               OR device_info.sim_type IS NOT excluded.sim_type
+               OR device_info.active = 0
+        ''')
+
+        deactivated = []
+        if deactivate_missing:
+            deactivated = [row[0] for row in conn.execute('''
+                SELECT device FROM device_info
+                WHERE active = 1 AND device NOT IN (SELECT device FROM device_stage)
+            ''')]
+            conn.execute('''
+                UPDATE device_info SET active = 0
+                WHERE active = 1 AND device NOT IN (SELECT device FROM device_stage)
+            ''')
+        bump_data_version(conn, inserted + updated + deactivated)
+
+    return {
+        'inserted': len(inserted),
+        'updated': len(updated),
+        'unchanged': len(df) - len(inserted) - len(updated),
+        'deactivated': len(deactivated)
+    }
 
-    column_mapping = {
+
+GPS_COLUMN_MAPPING = {
     'sl._no': 'sl_no',
     'sl no': 'sl_no',
     'device_id': 'device',
@@ -622,129 +1607,906 @@ def import_csv(file_path, date_format='mmddyyyy'):
     'battery_voltage(v)': 'battery_voltage'
 }
 
-    df.rename(columns=column_mapping, inplace=True)
+GPS_COLUMNS = ['sl_no', 'device', 'event', 'tracking_date', 'battery_voltage']
+
+# events counted as pings on the tracker page
+PING_EVENTS = ('G_PING', 'REBOOT')
+
+
+# Candidate tracking_date layouts, most likely first for each upload setting
+TIMESTAMP_FORMATS = {
+    'mmddyyyy': ('%m/%d/%Y %I:%M:%S %p', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M', '%m/%d/%Y'),
+    'ddmmyyyy': ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %I:%M:%S %p', '%d/%m/%Y %H:%M', '%d/%m/%Y',
+                 '%d-%m-%Y %H:%M:%S', '%d-%m-%Y %H:%M'),
+}
+ISO_TIMESTAMP_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+TIMESTAMP_SAMPLE_SIZE = 500
+BAD_TIMESTAMP_SAMPLES = 10
+
+
+def sniff_timestamp_format(values, date_format='mmddyyyy'):
+    """Pick the explicit format that parses a sample of ``values``.
+
+    Candidates for the chosen upload setting are tried before the other
+    day/month order, then ISO layouts; the first one parsing the whole
+    sample wins, otherwise the one parsing most of it. Returns ``None`` if
+    no format parses at least half of the sample.
+    """
+    import pandas as pd
+    other = 'ddmmyyyy' if date_format == 'mmddyyyy' else 'mmddyyyy'
+    candidates = TIMESTAMP_FORMATS.get(date_format, ()) + TIMESTAMP_FORMATS[other] + ISO_TIMESTAMP_FORMATS
+    sample = pd.Series(values).dropna().drop_duplicates()
+    sample = sample[sample != ''].head(TIMESTAMP_SAMPLE_SIZE)
+    if sample.empty:
+        return None
+    best, best_parsed = None, len(sample) / 2
+    for fmt in candidates:
+        parsed = pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum()
+        if parsed == len(sample):
+            return fmt
+        if parsed > best_parsed:
+            best, best_parsed = fmt, parsed
+    return best
+
+
+def parse_timestamps(values, fmt=None, date_format='mmddyyyy'):
+    """Parse timestamp strings once per distinct value and map the results back.
+
+    With ``fmt`` None the (slow) per-value inference is used, still only on
+    the distinct strings. Unparseable values become NaT.
+    """
+    import pandas as pd
+    codes, uniques = pd.factorize(values)
+    if fmt:
+        parsed = pd.to_datetime(uniques, format=fmt, errors='coerce')
+    else:
+        parsed = pd.to_datetime(pd.Series(uniques, dtype=object), errors='coerce',
+                                dayfirst=date_format == 'ddmmyyyy', format='mixed')
+    # factorize marks missing values with -1, which take() fills with NaT
+    parsed = pd.DatetimeIndex(parsed).take(codes, allow_fill=True, fill_value=pd.NaT)
+    return pd.Series(parsed, index=values.index)
+
+
+def clean_gps_chunk(df, date_format='mmddyyyy', timestamp_format=None):
+    """Normalize one raw CSV chunk into gps_data rows (drops unusable rows).
+
+    ``timestamp_format`` is sniffed from the chunk when not given. Returns
+    the cleaned frame, the timestamp format used and the raw tracking_date
+    values that could not be parsed (blank cells are only dropped).
+    """
+    import pandas as pd
+    df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
+    df.rename(columns=GPS_COLUMN_MAPPING, inplace=True)
     df.columns = df.columns.str.strip().str.lower()
 
-    required = ['sl_no', 'device', 'event', 'tracking_date', 'battery_voltage']
-    missing = [col for col in required if col not in df.columns]
+    missing = [col for col in GPS_COLUMNS if col not in df.columns]
     if missing:
         raise ValueError(f"Missing required columns: {missing}")
 
-    df = df[required].copy()
+    df = df[GPS_COLUMNS].copy()
 
     # Normalize text
-    df['event'] = df['event'].astype(str).str.strip().str.upper()
-    df['device'] = df['device'].astype(str).str.strip()
+    df['event'] = df['event'].astype(str).str.strip().str.upper().astype('category')
+    df['device'] = df['device'].astype(str).str.strip().astype('category')
 
-    # Parse tracking_date robustly
-    df['tracking_date'] = df['tracking_date'].astype(str).str.strip()
-    parsed = None
-    try:
-        if date_format == 'ddmmyyyy':
-            parsed = pd.to_datetime(df['tracking_date'], dayfirst=True, errors='raise')
-        else:
-            # try common format with time
-            parsed = pd.to_datetime(df['tracking_date'], format='%m/%d/%Y %I:%M:%S %p', errors='raise')
-    except Exception:
-        parsed = pd.to_datetime(df['tracking_date'], errors='coerce')
+    # Parse tracking_date with one explicit format; bad rows are reported, not re-parsed
+    raw_dates = df['tracking_date'].astype(str).str.strip()
+    if timestamp_format is None:
+        timestamp_format = sniff_timestamp_format(raw_dates, date_format)
+    parsed = parse_timestamps(raw_dates, timestamp_format, date_format)
+    blank = df['tracking_date'].isna() | (raw_dates == '')
+    bad_dates = raw_dates[parsed.isna() & ~blank]
 
     df['tracking_date'] = parsed
     # Ensure battery voltage numeric
     df['battery_voltage'] = pd.to_numeric(df['battery_voltage'], errors='coerce')
     df.dropna(subset=['tracking_date', 'battery_voltage', 'device'], inplace=True)
+    return df, timestamp_format, bad_dates
+
+
+def write_gps_chunk(conn, df):
+    """Insert the new rows of a cleaned chunk and roll them up, without committing.
+
+    Rows whose (device, tracking_date, event, sl_no) key is already stored,
+    or repeated within the chunk, are skipped, as are rows older than the raw
+    retention horizon (their period only exists as aggregates now). Returns
+    the number of new rows, ``{device: earliest new tracking_date}`` and the
+    number of rows skipped as expired.
+    """
+    import pandas as pd
+    conn.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS gps_stage (
+            sl_no INTEGER, device TEXT, event TEXT, tracking_date INTEGER, battery_voltage REAL
+        )
+    ''')
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS gps_new AS SELECT * FROM gps_stage WHERE 0')
+    conn.execute('DELETE FROM gps_stage')
+    conn.execute('DELETE FROM gps_new')
+
+    rows = df.assign(tracking_date=to_epoch(df['tracking_date'])).itertuples(index=False, name=None)
+    conn.executemany('INSERT INTO gps_stage VALUES (?, ?, ?, ?, ?)', rows)
+    horizon = raw_horizon(conn)
+    rows_expired = conn.execute(
+        'SELECT COUNT(*) FROM gps_stage WHERE tracking_date < ?', (horizon,)
+    ).fetchone()[0]
+    conn.execute('''
+        INSERT INTO gps_new
+        SELECT * FROM gps_stage s
+        WHERE s.rowid IN (
+            SELECT MIN(rowid) FROM gps_stage GROUP BY device, tracking_date, event, sl_no
+        )
+        AND s.tracking_date >= ?
+        AND NOT EXISTS (
+            SELECT 1 FROM gps_data g
+            WHERE g.device = s.device AND g.tracking_date = s.tracking_date
+              AND g.event = s.event AND g.sl_no IS s.sl_no
+        )
+    ''', (horizon,))
+    before = conn.total_changes
+    conn.execute('INSERT OR IGNORE INTO gps_data SELECT * FROM gps_new')
+    rows_new = conn.total_changes - before
+
+    # same transaction as the rows, so the rollup never drifts from gps_data
+    conn.execute('''
+        INSERT INTO daily_ping_counts (device, day, event, count)
+        SELECT device, tracking_date - tracking_date % 86400, event, COUNT(*)
+        FROM gps_new WHERE true
+        GROUP BY 1, 2, 3
+        ON CONFLICT(device, day, event) DO UPDATE SET count = count + excluded.count
+    ''')
+    # SET expressions see the old row, so last_seen is compared before it moves;
+    # ping_count counts PING_EVENTS like the /tracker total
+    conn.execute(f'''
+        INSERT INTO device_status (device, last_seen, last_voltage, last_event, ping_count)
+        SELECT device, MAX(tracking_date), battery_voltage, event,
+               SUM(event IN ({', '.join('?' * len(PING_EVENTS))}))
+        FROM gps_new WHERE tracking_date IS NOT NULL
+        GROUP BY device
+        ON CONFLICT(device) DO UPDATE SET
+            last_seen = MAX(last_seen, excluded.last_seen),
+            last_voltage = CASE WHEN excluded.last_seen >= last_seen
+                                THEN excluded.last_voltage ELSE last_voltage END,
+            last_event = CASE WHEN excluded.last_seen >= last_seen
+                              THEN excluded.last_event ELSE last_event END,
+            ping_count = ping_count + excluded.ping_count
+    ''', PING_EVENTS)
+    if current_app.config['STORAGE_BACKEND'] == 'parquet':
+        write_parquet_partitions(conn, pd.read_sql_query('SELECT * FROM gps_new', conn))
+    touched = dict(conn.execute('SELECT device, MIN(tracking_date) FROM gps_new GROUP BY device'))
+    return rows_new, touched, rows_expired
+
+
+def _read_gps_chunks(file_path, date_format='mmddyyyy', chunksize=None):
+    """Yield ``(rows_read, cleaned, timestamp_format, bad_dates)`` per CSV chunk.
+
+    The timestamp format is sniffed from the first chunk and reused for the rest.
+    """
+    import pandas as pd
+    timestamp_format = None
+    for chunk in pd.read_csv(file_path, low_memory=False, chunksize=chunksize):
+        rows_read = len(chunk)
+        chunk, timestamp_format, bad_dates = clean_gps_chunk(chunk, date_format, timestamp_format)
+        yield rows_read, chunk, timestamp_format, bad_dates
+
+
+def _parse_gps_file(file_path, date_format, chunksize, spool_dir):
+    """Process-pool worker: parse and clean one export without touching the database.
+
+    Each cleaned chunk is pickled into ``spool_dir`` so neither the worker
+    nor the parent holds a whole file; returns ``(rows_read, path, timestamp_format)``
+    per chunk.
+    """
+    parts = []
+    for rows_read, chunk, timestamp_format, bad_dates in _read_gps_chunks(file_path, date_format, chunksize):
+        part = os.path.join(spool_dir, f"{uuid.uuid4().hex}.pkl")
+        with open(part, 'wb') as f:
+            pickle.dump((chunk, bad_dates), f, protocol=pickle.HIGHEST_PROTOCOL)
+        parts.append((rows_read, part, timestamp_format))
+    return parts
+
+
+def _spooled_chunks(parts):
+    """Load the chunks written by ``_parse_gps_file`` one at a time, deleting each after use."""
+    for rows_read, part, timestamp_format in parts:
+        with open(part, 'rb') as f:
+            chunk, bad_dates = pickle.load(f)
+        os.remove(part)
+        yield rows_read, chunk, timestamp_format, bad_dates
+
+
+def write_gps_chunks(chunks, progress=None):
+    """Write cleaned chunks through one connection in large transactions.
+
+    ``chunks`` yields ``(rows_read, cleaned, timestamp_format, bad_dates)``;
+    rows are committed every ``IMPORT_COMMIT_ROWS`` rows together with the
+    charge events and data versions of the devices they touched, so an
+    import that dies midway leaves nothing half-derived. Rows whose
+    tracking_date does not parse are counted in ``rows_bad_timestamp`` (a few
+    examples in ``bad_timestamp_samples``). ``progress`` (if given) is called
+    with the per-chunk stats. Returns the totals.
+    """
+    commit_rows = current_app.config['IMPORT_COMMIT_ROWS']
+    counters = ('rows_read', 'rows_dropped', 'rows_bad_timestamp', 'rows_duplicate', 'rows_expired',
+                'rows_written')
+    totals = dict.fromkeys(('chunks',) + counters, 0)
+    totals.update(timestamp_format=None, bad_timestamp_samples=[])
+    touched = {}  # device -> earliest new tracking_date (epoch) since the last commit
+
+    def commit():
+        for device, since in touched.items():
+            refresh_charge_events(conn, device, int(since))
+        bump_data_version(conn, touched)
+        conn.commit()
+        touched.clear()
+
+    create_tables()
+    with get_db() as conn:
+        pending = 0
+        for rows_read, chunk, fmt, bad_dates in chunks:
+            totals['timestamp_format'] = fmt
+            samples = totals['bad_timestamp_samples']
+            samples.extend(bad_dates.drop_duplicates().head(BAD_TIMESTAMP_SAMPLES - len(samples)))
+            rows_written, first_new, rows_expired = write_gps_chunk(conn, chunk)
+            for device, first in first_new.items():
+                touched[device] = min(first, touched.get(device, first))
+
+            pending += len(chunk)
+            if pending >= commit_rows:
+                commit()
+                pending = 0
+
+            stats = {
+                'chunk': totals['chunks'] + 1,
+                'rows_read': rows_read,
+                'rows_dropped': rows_read - len(chunk),
+                'rows_bad_timestamp': len(bad_dates),
+                'rows_duplicate': len(chunk) - rows_written - rows_expired,
+                'rows_expired': rows_expired,
+                'rows_written': rows_written
+            }
+            totals['chunks'] += 1
+            for key in counters:
+                totals[key] += stats[key]
+
+            current_app.logger.info(
+                "import chunk %(chunk)d: read=%(rows_read)d dropped=%(rows_dropped)d "
+                "bad_timestamp=%(rows_bad_timestamp)d duplicate=%(rows_duplicate)d "
+                "expired=%(rows_expired)d written=%(rows_written)d", stats
+            )
+            if progress:
+                progress(stats)
+        commit()
+        if current_app.config['STORAGE_BACKEND'] == 'parquet':
+            compact_parquet(conn)
+
+        if totals['rows_bad_timestamp']:
+            current_app.logger.warning(
+                "import: %d rows with unparseable tracking_date (format %s), e.g. %s",
+                totals['rows_bad_timestamp'], totals['timestamp_format'],
+                totals['bad_timestamp_samples']
+            )
+
+    return totals
+
+
+def import_csv(file_path, date_format='mmddyyyy', chunksize=None, progress=None):
+    """Stream a GPS export into gps_data in fixed-size chunks.
+
+    Peak memory is bounded by ``chunksize`` rather than the file size.
+    Re-importing overlapping exports is idempotent: already stored rows
+    count as duplicates. See ``write_gps_chunks`` for the returned totals.
+    """
+    chunksize = chunksize or current_app.config['IMPORT_CHUNK_SIZE']
+    return write_gps_chunks(_read_gps_chunks(file_path, date_format, chunksize), progress)
+
+
+def import_csv_batch(file_paths, date_format='mmddyyyy', workers=None, progress=None):
+    """Import several GPS exports, parsing them in parallel worker processes.
+
+    Each file is read and cleaned in a process pool of ``workers`` (default
+    IMPORT_PARSE_WORKERS, else one per core) that spools the cleaned chunks
+    to temporary files; this process writes them as files finish, so the
+    import takes about as long as the slowest file plus the writes and
+    memory stays bounded by the chunk size. Returns the totals plus ``files``.
+    """
+    chunksize = current_app.config['IMPORT_CHUNK_SIZE']
+    workers = workers or current_app.config['IMPORT_PARSE_WORKERS'] or os.cpu_count()
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+
+    def parsed_chunks():
+        # spawn, not fork: this runs on request/ingest threads, and a forked child could
+        # inherit locks (SQLite pool, logging) held by other threads
+        with tempfile.TemporaryDirectory(dir=upload_folder) as spool_dir, \
+                ProcessPoolExecutor(max_workers=min(workers, len(file_paths)),
+                                    mp_context=multiprocessing.get_context('spawn')) as pool:
+            # as_completed drops each future once yielded, so no list of them is kept here
+            for future in as_completed([pool.submit(_parse_gps_file, path, date_format, chunksize, spool_dir)
+                                        for path in file_paths]):
+                yield from _spooled_chunks(future.result())
+
+    totals = write_gps_chunks(parsed_chunks() if file_paths else iter(()), progress)
+    totals['files'] = len(file_paths)
+    return totals
+
+
+def expand_upload(path, dest_dir):
+    """Paths of the CSV exports in an uploaded ``.csv``, ``.gz`` or ``.zip`` file.
+
+    Zip members are extracted next to the upload (the archive is removed);
+    gzip files are left for pandas to decompress while reading.
+    """
+    if not path.lower().endswith('.zip'):
+        return [path]
+    paths = []
+    try:
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                name = os.path.basename(member.filename)
+                if member.is_dir() or name.startswith('.') or not allowed_file(name, ('csv', 'gz')):
+                    continue
+                suffix = '.csv.gz' if name.lower().endswith('.gz') else '.csv'
+                member_path = os.path.join(dest_dir, f"{uuid.uuid4().hex}{suffix}")
+                paths.append(member_path)
+                with archive.open(member) as src, open(member_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+    except Exception:
+        # the caller still owns (and removes) the archive itself
+        for member_path in paths:
+            if os.path.exists(member_path):
+                os.remove(member_path)
+        raise
+    os.remove(path)
+    return paths
+
+# -------------------------
+# Background ingest jobs
+# -------------------------
+# Job state lives in small JSON files so any worker process can report it.
+# Each app runs jobs on one background thread (app.extensions['ingest_executor']):
+# SQLite has a single writer, so jobs queue behind each other instead of racing
+# for the write lock; jobs in other processes wait on it (BEGIN IMMEDIATE).
+
+
+def _job_path(job_id):
+    return os.path.join(current_app.config['JOBS_FOLDER'], f"{uuid.UUID(job_id).hex}.json")
+
+
+def save_job(job):
+    path = _job_path(job['id'])
+    with open(path + '.tmp', 'w') as f:
+        json.dump(job, f)
+    os.replace(path + '.tmp', path)
+
+
+def load_job(job_id):
+    try:
+        with open(_job_path(job_id)) as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return None
+
+
+def submit_ingest(paths, kind, date_format='mmddyyyy'):
+    """Queue uploaded files for import and return the job record.
+
+    Several GPS files are imported as one batch (see ``import_csv_batch``).
+    """
+    job = {
+        'id': uuid.uuid4().hex,
+        'kind': kind,
+        'files': len(paths),
+        'phase': 'queued',
+        'submitted': datetime.now().isoformat(timespec='seconds'),
+        'started': None,
+        'finished': None,
+        'chunks': 0,
+        'rows_read': 0,
+        'rows_dropped': 0,
+        'rows_bad_timestamp': 0,
+        'bad_timestamp_samples': [],
+        'rows_duplicate': 0,
+        'rows_expired': 0,
+        'rows_written': 0,
+        'rows_per_sec': 0.0,
+        'error': None
+    }
+    save_job(job)
+    current_app.extensions['ingest_executor'].submit(
+        _run_ingest, current_app._get_current_object(), job, paths, date_format
+    )
+    return job
+
+
+def _run_ingest(app, job, paths, date_format):
+    with app.app_context():
+        _ingest(job, paths, date_format)
+
+
+def _ingest(job, paths, date_format):
+    started = time.monotonic()
+    job.update(phase='importing', started=datetime.now().isoformat(timespec='seconds'))
+    save_job(job)
+
+    def progress(stats):
+        for key in ('rows_read', 'rows_dropped', 'rows_bad_timestamp', 'rows_duplicate', 'rows_expired',
+                    'rows_written'):
+            job[key] += stats[key]
+        job['chunks'] += 1
+        job['rows_per_sec'] = job['rows_read'] / max(time.monotonic() - started, 1e-6)
+        save_job(job)
+
+    try:
+        if job['kind'] == 'device_info':
+            job['devices'] = import_device_info(paths[0])
+        else:
+            if len(paths) == 1:
+                totals = import_csv(paths[0], date_format, progress=progress)
+            else:
+                totals = import_csv_batch(paths, date_format, progress=progress)
+            job['bad_timestamp_samples'] = totals['bad_timestamp_samples']
+        job['phase'] = 'done'
+    except Exception as e:
+        current_app.logger.exception("Ingest job %s failed", job['id'])
+        job.update(phase='failed', error=str(e))
+    finally:
+        job['finished'] = datetime.now().isoformat(timespec='seconds')
+        job['rows_per_sec'] = job['rows_read'] / max(time.monotonic() - started, 1e-6)
+        save_job(job)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# -------------------------
+# Retention tiers
+# -------------------------
+# tier -> (source table, time column, (min, max, sum, count) of a source row,
+#          target table, bucket column, bucket width)
+ROLLUPS = {
+    'raw': ('gps_data', 'tracking_date', ('battery_voltage', 'battery_voltage', 'battery_voltage', '1'),
+            'gps_hourly', 'hour', 3600),
+    'hourly': ('gps_hourly', 'hour', ('min_voltage', 'max_voltage', 'sum_voltage', 'count'),
+               'gps_daily', 'day', 86400),
+}
+
+
+def raw_horizon(conn):
+    """Epoch before which raw pings have been rolled into gps_hourly (0 if never)."""
+    # migrations before v9 rebuild charge events without retention_state
+    if not table_exists(conn, 'retention_state'):
+        return 0
+    row = conn.execute("SELECT rolled_before FROM retention_state WHERE tier = 'raw'").fetchone()
+    return row[0] if row else 0
+
+
+def _roll_tier(conn, tier, before, batch_rows):
+    """Aggregate ``tier`` rows older than ``before`` into the next tier and delete them.
+
+    Works in transactions of ``batch_rows`` source rows; aggregates merge
+    into existing buckets, so late or partial batches add up. Returns the
+    rows moved and the devices touched.
+    """
+    source, time_col, values, target, bucket_col, width = ROLLUPS[tier]
+    lo, hi, total, n = values
+    conn.execute(
+        """
+        INSERT INTO retention_state (tier, rolled_before) VALUES (?, ?)
+        ON CONFLICT(tier) DO UPDATE SET rolled_before = MAX(rolled_before, excluded.rolled_before)
+        """,
+        (tier, before)
+    )
+    moved, touched = 0, set()
+    while True:
+        conn.execute('DROP TABLE IF EXISTS temp.retention_batch')
+        conn.execute(
+            f"""
+            CREATE TEMP TABLE retention_batch AS
+            SELECT rowid AS rid, device, {time_col} - {time_col} % {width} AS bucket,
+                   {lo} AS lo, {hi} AS hi, {total} AS total, {n} AS n
+            FROM {source} WHERE {time_col} < ? LIMIT ?
+            """,
+            (before, batch_rows)
+        )
+        rows = conn.execute('SELECT COUNT(*) FROM retention_batch').fetchone()[0]
+        if not rows:
+            break
+        conn.execute(f'''
+            INSERT INTO {target} (device, {bucket_col}, min_voltage, max_voltage, sum_voltage, count)
+            SELECT device, bucket, MIN(lo), MAX(hi), SUM(total), SUM(n)
+            FROM retention_batch WHERE true
+            GROUP BY device, bucket
+            ON CONFLICT(device, {bucket_col}) DO UPDATE SET
+                min_voltage = MIN(min_voltage, excluded.min_voltage),
+                max_voltage = MAX(max_voltage, excluded.max_voltage),
+                sum_voltage = sum_voltage + excluded.sum_voltage,
+                count = count + excluded.count
+        ''')
+        touched.update(device for (device,) in conn.execute('SELECT DISTINCT device FROM retention_batch'))
+        conn.execute(f'DELETE FROM {source} WHERE rowid IN (SELECT rid FROM retention_batch)')
+        conn.commit()
+        moved += rows
+    conn.execute('DROP TABLE IF EXISTS temp.retention_batch')
+    conn.commit()
+    return moved, touched
+
+
+def _prune_parquet(conn, before):
+    """Drop Parquet files whose rows all lie before ``before``. Returns the number removed."""
+    paths = [path for (path,) in conn.execute("SELECT path FROM parquet_files WHERE max_ts < ?", (before,))]
+    conn.execute("DELETE FROM parquet_files WHERE max_ts < ?", (before,))
+    conn.commit()
+    for path in paths:
+        try:
+            os.remove(os.path.join(current_app.config['PARQUET_ROOT'], path))
+        except FileNotFoundError:
+            pass
+    return len(paths)
+
+
+def run_retention(now=None, raw_days=None, hourly_days=None, batch_rows=None):
+    """Apply the retention tiers, then hand freed pages back to the filesystem.
+
+    Raw pings older than ``raw_days`` (default RETENTION_RAW_DAYS) become
+    hourly min/max/sum/count rows, and hourly rows older than
+    ``hourly_days`` (RETENTION_HOURLY_DAYS, None keeps them) become daily
+    rows. Daily ping counts and charge events are kept as they are.
+    ``now`` is epoch seconds in the same wall-clock time as tracking_date.
+    Returns a dict of counts.
+    """
+    config = current_app.config
+    raw_days = config['RETENTION_RAW_DAYS'] if raw_days is None else raw_days
+    hourly_days = config['RETENTION_HOURLY_DAYS'] if hourly_days is None else hourly_days
+    batch_rows = batch_rows or config['RETENTION_BATCH_ROWS']
+    if now is None:
+        now = now_epoch()
+
+    stats = {'raw_rolled': 0, 'hourly_rolled': 0, 'devices': 0, 'parquet_files_removed': 0, 'pages_freed': 0}
+    create_tables()
+    conn = get_db()
+    touched = set()
+    if raw_days is not None:
+        raw_before = now - raw_days * 86400
+        raw_before -= raw_before % 3600
+        stats['raw_rolled'], devices = _roll_tier(conn, 'raw', raw_before, batch_rows)
+        touched |= devices
+        stats['parquet_files_removed'] = _prune_parquet(conn, raw_before)
+        if hourly_days is not None:
+            hourly_before = min(now - hourly_days * 86400, raw_before)
+            hourly_before -= hourly_before % 86400
+            stats['hourly_rolled'], devices = _roll_tier(conn, 'hourly', hourly_before, batch_rows)
+            touched |= devices
+    if touched:
+        bump_data_version(conn, touched)
+        conn.commit()
+    stats['devices'] = len(touched)
+
+    # only databases created with auto_vacuum = INCREMENTAL can shrink in place
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        freed = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        # executescript steps the pragma to completion; a plain execute frees a single page
+        conn.executescript('PRAGMA incremental_vacuum')
+        stats['pages_freed'] = freed - conn.execute('PRAGMA freelist_count').fetchone()[0]
+    elif stats['raw_rolled']:
+        current_app.logger.info("retention: run `flask retention --vacuum-full` once to enable incremental vacuum")
+
+    current_app.logger.info(
+        "retention: rolled %(raw_rolled)d raw and %(hourly_rolled)d hourly rows for %(devices)d devices, "
+        "freed %(pages_freed)d pages", stats
+    )
+    return stats
+
+
+def _retention_loop(app, interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                run_retention()
+            except Exception:
+                app.logger.exception("Retention run failed")
+
+
+def start_retention_scheduler(app):
+    """Run ``run_retention`` every RETENTION_INTERVAL_HOURS in a daemon thread."""
+    interval = app.config['RETENTION_INTERVAL_HOURS'] * 3600
+    threading.Thread(target=_retention_loop, args=(app, interval),
+                     name='retention', daemon=True).start()
 
-    # Write to DB (append)
-    with sqlite3.connect(DB_NAME) as conn:
-        # to_sql will create gps_data if necessary; ensure types are fine
-        df.to_sql('gps_data', conn, if_exists='append', index=False)
 
 # -------------------------
 # Charge detection & charting
 # -------------------------
-def detect_charges(df, rise_threshold=0.15, window=3):
+def charge_cycles(df, rise_threshold=0.15, window=3):
+    """Detect merged charge cycles on NumPy arrays (no UI formatting).
+
+    A candidate is any row whose voltage rises by ``rise_threshold`` within
+    ``window`` rows; the cycle ends at the first max of that window and the
+    scan resumes there. Cycles less than 60 minutes apart are merged.
+    """
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
     if df.empty:
         return []
 
-    df = df.sort_values('tracking_date').reset_index(drop=True)
-    voltages = df['battery_voltage'].tolist()
-    timestamps = df['tracking_date'].tolist()
-    raw_charges = []
-    i = 0
-
-    while i < len(voltages) - window:
-        start_voltage = voltages[i]
-        end_voltage = voltages[i + window]
-
-        if pd.notna(start_voltage) and pd.notna(end_voltage) and end_voltage - start_voltage >= rise_threshold:
-            window_slice = voltages[i:i+window+1]
-            max_voltage = max(window_slice)
-            max_index = i + window_slice.index(max_voltage)
-
-            start_time = timestamps[i]
-            end_time = timestamps[max_index]
-            charge_duration = end_time - start_time
-            days_offline = charge_duration.total_seconds() / (24 * 3600)
-
-            raw_charges.append({
-                'start_time_dt': start_time,
-                'end_time_dt': end_time,
-                'date': start_time.date() if hasattr(start_time, 'date') else None,
-                'start_voltage': start_voltage,
-                'max_voltage': max_voltage,
-                'duration': charge_duration,
-                'days_offline': days_offline,
-                'is_long_offline': days_offline >= 2
-            })
-
-            i = max_index
-        else:
-            i += 1
-
-    # Merge nearby events (<60 mins apart)
-    merged_charges = []
-    for charge in raw_charges:
-        if not merged_charges:
-            merged_charges.append(charge)
-            continue
+    df = df[['tracking_date', 'battery_voltage']].sort_values('tracking_date')
+    timestamps = df['tracking_date'].array
+    # rounded so float32 voltages cross rise_threshold exactly where the stored values do
+    voltages = stored_voltages(df['battery_voltage'].to_numpy())
+    n = len(voltages)
+    if n <= window:
+        return []
 
-        last = merged_charges[-1]
-        if charge['start_time_dt'] - last['end_time_dt'] <= timedelta(minutes=60):
-            last['end_time_dt'] = max(last['end_time_dt'], charge['end_time_dt'])
-            last['max_voltage'] = max(last.get('max_voltage', 0), charge['max_voltage'])
-            last['start_voltage'] = min(last.get('start_voltage', 9999), charge['start_voltage'])
-            last['duration'] = last['end_time_dt'] - last['start_time_dt']
-            last['days_offline'] = last['duration'].total_seconds() / (24 * 3600)
-            last['is_long_offline'] = last['days_offline'] >= 2
-        else:
-            merged_charges.append(charge)
+    with np.errstate(invalid='ignore'):
+        rises = voltages[window:] - voltages[:n - window] >= rise_threshold
+    candidates = np.flatnonzero(rises)
+    if not candidates.size:
+        return []
 
-    # Format for UI
-    for charge in merged_charges:
-        charge['start_time'] = charge['start_time_dt'].strftime('%I:%M:%S %p')
-        charge['end_time'] = charge['end_time_dt'].strftime('%I:%M:%S %p')
-        charge['date'] = charge['start_time_dt'].strftime('%d-%m-%Y')
+    # first max of each candidate window; NaNs can never be the max
+    filled = np.where(np.isnan(voltages), -np.inf, voltages)
+    windows = sliding_window_view(filled, window + 1)[candidates]
+    max_idx = candidates + windows.argmax(axis=1)
+
+    # the scan resumes at each cycle's max, so walk only the hits
+    hits = []
+    pos = 0
+    while pos < candidates.size:
+        hits.append(pos)
+        resume = max(max_idx[pos], candidates[pos] + 1)
+        pos = int(np.searchsorted(candidates, resume))
+    start_idx = candidates[hits]
+    end_idx = max_idx[hits]
+
+    # merge cycles starting <= 60 mins after the previous one ended
+    ts = timestamps.to_numpy()
+    gaps = ts[start_idx[1:]] - ts[end_idx[:-1]]
+    group_starts = np.flatnonzero(np.r_[True, gaps > np.timedelta64(60, 'm')])
+    group_ends = np.r_[group_starts[1:], len(hits)] - 1
+    start_voltages = np.minimum.reduceat(voltages[start_idx], group_starts)
+    max_voltages = np.maximum.reduceat(voltages[end_idx], group_starts)
+
+    charges = []
+    for k, (first, last) in enumerate(zip(group_starts, group_ends)):
+        start_time = timestamps[start_idx[first]]
+        end_time = timestamps[end_idx[last]]
+        duration = end_time - start_time
+        days_offline = duration.total_seconds() / (24 * 3600)
+        charges.append({
+            'start_time_dt': start_time,
+            'end_time_dt': end_time,
+            'date': start_time.date(),
+            'start_voltage': float(start_voltages[k]),
+            'max_voltage': float(max_voltages[k]),
+            'duration': duration,
+            'days_offline': days_offline,
+            'is_long_offline': days_offline >= 2
+        })
+    return charges
+
+
+def format_charge(charge):
+    """Add the display fields used by the charge table (in place)."""
+    charge['start_time'] = charge['start_time_dt'].strftime('%I:%M:%S %p')
+    charge['end_time'] = charge['end_time_dt'].strftime('%I:%M:%S %p')
+    charge['date'] = charge['start_time_dt'].strftime('%d-%m-%Y')
+
+    total_seconds = charge['duration'].total_seconds()
+    days = int(total_seconds // 86400)
+    hours = int((total_seconds % 86400) // 3600)
+    minutes = int((total_seconds % 3600) // 60)
+    charge['duration'] = f"{days} days {hours} hrs {minutes} mins"
+
+    if charge['is_long_offline']:
+        charge['days_offline'] = f"{days} days {hours} hrs {minutes} mins"
+    return charge
 
-        total_seconds = charge['duration'].total_seconds()
-        days = int(total_seconds // 86400)
-        hours = int((total_seconds % 86400) // 3600)
-        minutes = int((total_seconds % 3600) // 60)
-        charge['duration'] = f"{days} days {hours} hrs {minutes} mins"
 
-        if charge['is_long_offline']:
-            charge['days_offline'] = f"{days} days {hours} hrs {minutes} mins"
+def detect_charges(df, rise_threshold=0.15, window=3):
+    return [format_charge(charge) for charge in charge_cycles(df, rise_threshold, window)]
+
+def refresh_charge_events(conn, device, since=None):
+    """Recompute ``device``'s charge_events from the boundary before ``since``.
+
+    Scan decisions more than ``window`` rows before the first new row cannot
+    change, so only the cycles from there on (widened to any stored cycle
+    that overlaps it or could merge with it) are deleted and re-detected.
+    ``since=None`` rebuilds the device from scratch. Does not commit.
+    """
+    window = 3
+    anchor = None
+    if since is not None:
+        row = conn.execute(
+            """
+            SELECT tracking_date FROM gps_data
+            WHERE device = ? AND tracking_date < ?
+            ORDER BY tracking_date DESC LIMIT 1 OFFSET ?
+            """,
+            (device, since, window)
+        ).fetchone()
+        if row:
+            anchor = row[0]
+            first = conn.execute(
+                "SELECT MIN(start_time) FROM charge_events WHERE device = ? AND end_time >= ?",
+                (device, anchor - 3600)
+            ).fetchone()[0]
+            if first is not None:
+                anchor = min(anchor, first)
+
+    if anchor is None:
+        anchor = conn.execute(
+            "SELECT MIN(tracking_date) FROM gps_data WHERE device = ?", (device,)
+        ).fetchone()[0]
+        if anchor is None:
+            return 0
+    # cycles before the raw retention horizon have no raw rows left to re-detect from
+    anchor = max(anchor, raw_horizon(conn))
+
+    conn.execute("DELETE FROM charge_events WHERE device = ? AND start_time >= ?", (device, anchor))
+    df = read_gps_rows(conn, device, anchor, backend='sqlite')
+    cycles = charge_cycles(df, window=window)
+    conn.executemany(
+        "INSERT OR REPLACE INTO charge_events VALUES (?, ?, ?, ?, ?)",
+        [
+            (device, epoch_seconds(c['start_time_dt']), epoch_seconds(c['end_time_dt']),
+             c['start_voltage'], c['max_voltage'])
+            for c in cycles
+        ]
+    )
+    return len(cycles)
+
+
+def load_charge_events(conn, device, start, end):
+    """Stored charge cycles starting in [start, end] (epoch), formatted for the UI."""
+    import pandas as pd
+    rows = conn.execute(
+        """
+        SELECT start_time, end_time, start_voltage, max_voltage FROM charge_events
+        WHERE device = ? AND start_time >= ? AND start_time <= ?
+        ORDER BY start_time
+        """,
+        (device, start, end)
+    ).fetchall()
+
+    charges = []
+    for start_time, end_time, start_voltage, max_voltage in rows:
+        start_dt = pd.Timestamp(start_time, unit='s')
+        end_dt = pd.Timestamp(end_time, unit='s')
+        duration = end_dt - start_dt
+        days_offline = duration.total_seconds() / (24 * 3600)
+        charges.append(format_charge({
+            'start_time_dt': start_dt,
+            'end_time_dt': end_dt,
+            'start_voltage': start_voltage,
+            'max_voltage': max_voltage,
+            'duration': duration,
+            'days_offline': days_offline,
+            'is_long_offline': days_offline >= 2
+        }))
+    return charges
+
+
+def load_daily_pings(conn, device, start, end):
+    """Daily ping counts for ``device`` between epoch ``start`` and ``end`` from the rollup."""
+    import pandas as pd
+    rows = conn.execute(
+        f"""
+        SELECT day, SUM(count) FROM daily_ping_counts
+        WHERE device = ? AND day >= ? AND day <= ?
+          AND event IN ({', '.join('?' * len(PING_EVENTS))})
+        GROUP BY day
+        ORDER BY day
+        """,
+        (device, start - start % 86400, end, *PING_EVENTS)
+    ).fetchall()
+    return pd.Series(
+        [count for _, count in rows],
+        index=from_epoch([day for day, _ in rows]),
+        dtype='int64'
+    )
 
-    return merged_charges
 
-def create_combined_chart(ping_series, charge_details, full_voltage_df, title="Activity Summary"):
+def load_daily_pings_many(conn, devices, start, end):
+    """``{device: daily ping count Series}`` for ``devices`` from one rollup query (see load_daily_pings)."""
+    import pandas as pd
+    rows = conn.execute(
+        f"""
+        SELECT device, day, SUM(count) FROM daily_ping_counts
+        WHERE device IN ({', '.join('?' * len(devices))}) AND day >= ? AND day <= ?
+          AND event IN ({', '.join('?' * len(PING_EVENTS))})
+        GROUP BY device, day
+        ORDER BY device, day
+        """,
+        (*devices, start - start % 86400, end, *PING_EVENTS)
+    )
+    counts = {}
+    for device, group in groupby(rows, key=itemgetter(0)):
+        days, values = zip(*[(day, count) for _, day, count in group])
+        counts[device] = pd.Series(values, index=from_epoch(list(days)), dtype='int64')
+    return counts
+
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: indices of ``n_out`` points that keep the shape of (x, y)."""
+    import numpy as np
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # first and last points are fixed; n_out - 2 buckets in between
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for k in range(n_out - 2):
+        lo, hi = edges[k], edges[k + 1]
+        next_hi = edges[k + 2] if k + 2 < len(edges) else n
+        avg_x = x[hi:next_hi].mean()
+        avg_y = y[hi:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        selected[k + 1] = a
+    return selected
+
+
+def minmax_indices(y, n_out):
+    """Indices of the min and max point of each of ``n_out // 2`` equal buckets."""
+    import numpy as np
+    n = len(y)
+    buckets = n_out // 2
+    if n_out >= n or buckets < 1:
+        return np.arange(n)
+
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    valid = ~np.isnan(padded).all(axis=1)
+    offsets = np.arange(buckets)[valid] * size
+    lows = offsets + np.nanargmin(padded[valid], axis=1)
+    highs = offsets + np.nanargmax(padded[valid], axis=1)
+    return np.unique(np.concatenate([lows, highs]))
+
+
+def downsample_voltage(df, max_points, method='lttb', keep_times=()):
+    """Reduce a tracking_date/battery_voltage frame to about ``max_points`` rows.
+
+    Rows whose tracking_date is in ``keep_times`` (charge start/max points)
+    are always kept so the line passes exactly through them.
+    """
+    import numpy as np
+    import pandas as pd
+    if not max_points or len(df) <= max_points:
+        return df
+
+    df = df.sort_values('tracking_date')
+    x = df['tracking_date'].to_numpy('datetime64[ns]').astype('int64').astype('float64')
+    y = df['battery_voltage'].to_numpy(dtype='float64')
+    if method == 'minmax':
+        idx = minmax_indices(y, max_points)
+    else:
+        idx = lttb_indices(x, y, max_points)
+
+    if len(keep_times):
+        keep = pd.to_datetime(pd.Series(list(keep_times))).to_numpy('datetime64[ns]').astype('int64')
+        idx = np.union1d(idx, np.flatnonzero(np.isin(x.astype('int64'), keep)))
+    return df.iloc[idx]
+
+
+def create_combined_chart(ping_counts, charge_details, full_voltage_df, title="Activity Summary",
+                          max_points=None, downsample=None):
+    """``ping_counts`` is a Series of ping counts indexed by day (see load_daily_pings).
+
+    The voltage trace is reduced to ``max_points`` (default CHART_MAX_POINTS)
+    with ``downsample`` ('lttb' or 'minmax') before plotting.
+    """
+    import pandas as pd
+    import plotly.graph_objs as go
+    import plotly.io as pio
     try:
         fig = go.Figure()
 
-        # ping_series may be dates or datetimes
-        if not isinstance(ping_series, (pd.Series, list)):
-            ping_series = pd.Series(ping_series)
-
-        ping_series = pd.to_datetime(ping_series, errors='coerce').dropna()
-        if ping_series.empty:
+        ping_counts = ping_counts[ping_counts > 0].sort_index()
+        if ping_counts.empty:
             return None
 
         # Prepare charge markers
@@ -772,21 +2534,24 @@ def create_combined_chart(ping_series, charge_details, full_voltage_df, title="A
             except Exception:
                 continue
 
-        ping_counts = ping_series.dt.normalize().value_counts().sort_index()
-        ping_dates = sorted(ping_counts.index)
-
         fig.add_trace(go.Bar(
-            x=ping_dates,
-            y=[ping_counts.get(date, 0) for date in ping_dates],
+            x=ping_counts.index,
+            y=ping_counts.values,
             name="Ping Count",
             yaxis='y1',
             hovertemplate='Date: %{x}<br>Pings: %{y}<extra></extra>'
         ))
 
         if not full_voltage_df.empty:
+            voltage_df = downsample_voltage(
+                full_voltage_df,
+                current_app.config['CHART_MAX_POINTS'] if max_points is None else max_points,
+                downsample or current_app.config['CHART_DOWNSAMPLE'],
+                keep_times=[t for c in charge_details for t in (c['start_time_dt'], c['end_time_dt'])]
+            )
             fig.add_trace(go.Scatter(
-                x=full_voltage_df['tracking_date'],
-                y=full_voltage_df['battery_voltage'],
+                x=voltage_df['tracking_date'],
+                y=voltage_df['battery_voltage'],
                 mode='lines',
                 name='Battery Voltage',
                 yaxis='y2',
@@ -804,8 +2569,8 @@ def create_combined_chart(ping_series, charge_details, full_voltage_df, title="A
                 hoverinfo='text'
             ))
 
-        min_date = ping_series.min()
-        max_date = ping_series.max()
+        min_date = ping_counts.index.min()
+        max_date = ping_counts.index.max()
         date_range = (max_date - min_date).days
 
         if date_range > 60:
@@ -829,21 +2594,663 @@ def create_combined_chart(ping_series, charge_details, full_voltage_df, title="A
                            config={'modeBarButtonsToRemove': ['select2d', 'lasso2d'],
                                    'scrollZoom': False, 'displayModeBar': True, 'displaylogo': False})
     except Exception as e:
-        app.logger.error(f"Error in create_combined_chart: {e}")
+        current_app.logger.error(f"Error in create_combined_chart: {e}")
+        return None
+
+
+def create_comparison_chart(series, title="Device Comparison", max_points=None, downsample=None):
+    """Overlay several devices on one chart: daily ping bars and a voltage line per device.
+
+    ``series`` is a list of dicts with ``device``, ``ping_counts`` (Series by
+    day), ``charges`` (load_charge_events output) and ``voltage`` (tracking_date /
+    battery_voltage frame). The CHART_MAX_POINTS budget (or ``max_points``)
+    is shared between the devices' voltage traces.
+    """
+    import plotly.colors
+    import plotly.graph_objs as go
+    import plotly.io as pio
+    try:
+        series = [s for s in series if not s['ping_counts'].empty or not s['voltage'].empty]
+        if not series:
+            return None
+
+        max_points = current_app.config['CHART_MAX_POINTS'] if max_points is None else max_points
+        per_device = max(max_points // len(series), 200) if max_points else max_points
+        palette = plotly.colors.qualitative.Plotly
+
+        fig = go.Figure()
+        for k, s in enumerate(series):
+            color = palette[k % len(palette)]
+            device = s['device']
+            ping_counts = s['ping_counts'][s['ping_counts'] > 0].sort_index()
+            if not ping_counts.empty:
+                fig.add_trace(go.Bar(
+                    x=ping_counts.index,
+                    y=ping_counts.values,
+                    name=f"{device} pings",
+                    legendgroup=device,
+                    marker_color=color,
+                    opacity=0.45,
+                    yaxis='y1',
+                    hovertemplate=f'{device}<br>Date: %{{x}}<br>Pings: %{{y}}<extra></extra>'
+                ))
+            if not s['voltage'].empty:
+                voltage_df = downsample_voltage(
+                    s['voltage'], per_device, downsample or current_app.config['CHART_DOWNSAMPLE'],
+                    keep_times=[t for c in s['charges'] for t in (c['start_time_dt'], c['end_time_dt'])]
+                )
+                fig.add_trace(go.Scatter(
+                    x=voltage_df['tracking_date'],
+                    y=voltage_df['battery_voltage'],
+                    mode='lines',
+                    name=f"{device} voltage",
+                    legendgroup=device,
+                    line=dict(color=color, width=1.5),
+                    yaxis='y2',
+                    hovertemplate=f'{device}<br>Date: %{{x|%d-%m-%Y %I:%M %p}}<br>Voltage: %{{y:.2f}}V<extra></extra>'
+                ))
+            if s['charges']:
+                fig.add_trace(go.Scatter(
+                    x=[c['start_time_dt'] for c in s['charges']],
+                    y=[c['start_voltage'] for c in s['charges']],
+                    mode='markers',
+                    name=f"{device} charge starts",
+                    legendgroup=device,
+                    showlegend=False,
+                    marker=dict(color=color, size=7, symbol='triangle-up'),
+                    yaxis='y2',
+                    hovertemplate=f'{device} charge<br>Start Voltage: %{{y:.2f}}V<br>Date: %{{x|%d-%m-%Y %I:%M %p}}<extra></extra>'
+                ))
+
+        fig.update_layout(
+            title=dict(text=title, x=0.5),
+            barmode='group',
+            xaxis={'title': "Date", 'tickangle': 45},
+            yaxis=dict(title="Ping Count", side='left', showgrid=False),
+            yaxis2=dict(title="Battery Voltage (V)", overlaying='y', side='right', showgrid=False, range=[2.8, 4.4]),
+            legend=dict(orientation="h", y=1.1, x=1, xanchor="right"),
+            margin=dict(l=40, r=40, t=50, b=120),
+            height=500,
+            dragmode=False
+        )
+
+        return pio.to_html(fig, full_html=False, include_plotlyjs='cdn',
+                           config={'modeBarButtonsToRemove': ['select2d', 'lasso2d'],
+                                   'scrollZoom': False, 'displayModeBar': True, 'displaylogo': False})
+    except Exception as e:
+        current_app.logger.error(f"Error in create_comparison_chart: {e}")
         return None
 
+# -------------------------
+# Fleet analysis
+# -------------------------
+def fleet_devices(conn, region=None, branch=None):
+    """(device, region, branch) rows of active devices, optionally filtered."""
+    clauses, params = ["active = 1"], []
+    if region:
+        clauses.append("region = ?")
+        params.append(region)
+    if branch:
+        clauses.append("branch = ?")
+        params.append(branch)
+    return conn.execute(
+        f"SELECT device, region, branch FROM device_info WHERE {' AND '.join(clauses)} ORDER BY device",
+        params
+    ).fetchall()
+
+
+STATUS_FILTERS = {
+    'attention': "(s.last_seen IS NULL OR s.last_seen < :offline_before OR s.last_voltage < :low_voltage)",
+    'offline': "(s.last_seen IS NULL OR s.last_seen < :offline_before)",
+    'low_voltage': "s.last_voltage < :low_voltage",
+    'all': "1",
+}
+
+
+def fleet_status(conn, region=None, branch=None, status='attention', offline_before=0,
+                 low_voltage=0, limit=-1, offset=0):
+    """Active devices of a region/branch joined to device_status, longest silent first.
+
+    ``status`` (a STATUS_FILTERS key) keeps devices last seen before
+    ``offline_before`` (or never), those whose last voltage is below
+    ``low_voltage``, either of those, or all of them. Returns
+    ``(summary, rows)``; the summary counts cover the whole region/branch.
+    """
+    clauses = ["i.active = 1"]
+    params = {'offline_before': offline_before, 'low_voltage': low_voltage, 'limit': limit, 'offset': offset}
+    if region:
+        clauses.append("i.region = :region")
+        params['region'] = region
+    if branch:
+        clauses.append("i.branch = :branch")
+        params['branch'] = branch
+    where = " AND ".join(clauses)
+
+    total, offline, low = conn.execute(
+        f"""
+        SELECT COUNT(*), COALESCE(SUM({STATUS_FILTERS['offline']}), 0),
+               COALESCE(SUM({STATUS_FILTERS['low_voltage']}), 0)
+        FROM device_info i LEFT JOIN device_status s ON s.device = i.device
+        WHERE {where}
+        """,
+        params
+    ).fetchone()
+    rows = conn.execute(
+        f"""
+        SELECT i.device, i.region, i.branch, s.last_seen, s.last_voltage, s.last_event,
+               COALESCE(s.ping_count, 0)
+        FROM device_info i LEFT JOIN device_status s ON s.device = i.device
+        WHERE {where} AND {STATUS_FILTERS[status]}
+        ORDER BY s.last_seen IS NOT NULL, s.last_seen, i.device
+        LIMIT :limit OFFSET :offset
+        """,
+        params
+    ).fetchall()
+    return {'total': total, 'offline': offline, 'low_voltage': low}, rows
+
+
+def _init_worker(config):
+    """Process-pool initializer: give the worker its own app built from the parent's config."""
+    create_app(config).app_context().push()
+
+
+def worker_config():
+    """The settings a process-pool worker needs to rebuild the current app.
+
+    Background services stay in the parent: the retention scheduler is
+    switched off explicitly, since $ASSET_TRACKER_SETTINGS is read again in
+    the worker.
+    """
+    config = {key: current_app.config[key] for key in DEFAULT_CONFIG}
+    config['RETENTION_INTERVAL_HOURS'] = None
+    return config
+
+
+def _analyze_devices(devices, start, end):
+    """Process-pool worker: charge summary per device of a batch.
+
+    Charges come from the charge_events table /tracker reads (cycles
+    starting in [start, end]) and ``rows`` from daily_ping_counts, so
+    periods already rolled up by retention are still counted.
+    """
+    conn = connect_db(readonly=True)
+    marks = ', '.join('?' * len(devices))
+    try:
+        rows = dict(conn.execute(
+            f"""
+            SELECT device, SUM(count) FROM daily_ping_counts
+            WHERE device IN ({marks}) AND day >= ? AND day <= ?
+            GROUP BY device
+            """,
+            (*devices, start - start % 86400, end)
+        ))
+        charges = {
+            device: stats for device, *stats in conn.execute(
+                f"""
+                SELECT device, COUNT(*), SUM(end_time - start_time >= 2 * 86400), SUM(end_time - start_time)
+                FROM charge_events
+                WHERE device IN ({marks}) AND start_time >= ? AND start_time <= ?
+                GROUP BY device
+                """,
+                (*devices, start, end)
+            )
+        }
+    finally:
+        conn.close()
+
+    results = []
+    for device in devices:
+        count, long_offline, seconds = charges.get(device, (0, 0, 0))
+        charge_minutes = seconds / 60
+        results.append({
+            'device': device,
+            'rows': rows.get(device, 0),
+            'charges': count,
+            'long_offline': long_offline,
+            'charge_minutes': charge_minutes,
+            'avg_charge_minutes': charge_minutes / count if count else None
+        })
+    return results
+
+
+def _summarize(results):
+    charges = sum(r['charges'] for r in results)
+    charge_minutes = sum(r['charge_minutes'] for r in results)
+    return {
+        'devices': len(results),
+        'devices_reporting': sum(1 for r in results if r['rows']),
+        'charges': charges,
+        'long_offline': sum(r['long_offline'] for r in results),
+        'avg_charge_minutes': charge_minutes / charges if charges else None
+    }
+
+
+def analyze_fleet(start, end, region=None, branch=None, workers=None):
+    """Charge report for every device in a region/branch over [start, end] (epoch).
+
+    Devices are sharded into batches of FLEET_BATCH_SIZE across a process
+    pool of ``workers`` (default FLEET_WORKERS, else one per core); each
+    worker rebuilds the app from this app's config and opens its own
+    read-only connection.
+    """
+    with get_db(readonly=True) as conn:
+        devices = fleet_devices(conn, region, branch)
+    placement = {device: (dev_region, dev_branch) for device, dev_region, dev_branch in devices}
+
+    size = current_app.config['FLEET_BATCH_SIZE']
+    names = list(placement)
+    batches = [names[i:i + size] for i in range(0, len(names), size)]
+    workers = workers or current_app.config['FLEET_WORKERS'] or os.cpu_count()
+
+    results = []
+    if batches:
+        # spawn, not fork, from a threaded server (see import_csv_batch); workers rebuild the app anyway
+        with ProcessPoolExecutor(max_workers=min(workers, len(batches)),
+                                 mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(worker_config(),)) as pool:
+            futures = [pool.submit(_analyze_devices, batch, start, end) for batch in batches]
+            for future in futures:
+                results.extend(future.result())
+
+    for r in results:
+        r['region'], r['branch'] = placement[r['device']]
+
+    by_branch = {}
+    for r in results:
+        by_branch.setdefault(r['branch'], []).append(r)
+
+    return dict(
+        _summarize(results),
+        region=region,
+        branch=branch,
+        branches=[dict(_summarize(rows), branch=name)
+                  for name, rows in sorted(by_branch.items(), key=lambda item: str(item[0]))],
+        device_results=results
+    )
+
+
+# -------------------------
+# Export
+# -------------------------
+EXPORT_COLUMNS = ['sl_no', 'device', 'event', 'tracking_date', 'battery_voltage']
+
+
+def export_query(devices=(), region=None, branch=None, start=None, end=None):
+    """SQL + params selecting gps_data rows for the export filters, in device/time order.
+
+    Region and branch filters select the devices in a ``device IN (SELECT ...)``
+    subquery rather than a join, so rows come straight off the
+    (device, tracking_date) index in export order instead of being sorted
+    in a temp b-tree before the first row is sent.
+    """
+    clauses, params = [], []
+    if devices:
+        clauses.append(f"g.device IN ({', '.join('?' * len(devices))})")
+        params.extend(devices)
+    if region or branch:
+        filters = []
+        if region:
+            filters.append("region = ?")
+            params.append(region)
+        if branch:
+            filters.append("branch = ?")
+            params.append(branch)
+        clauses.append(f"g.device IN (SELECT device FROM device_info WHERE {' AND '.join(filters)})")
+    if not clauses:
+        raise ValueError("device, devices, region or branch is required")
+    if start is not None:
+        clauses.append("g.tracking_date >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("g.tracking_date <= ?")
+        params.append(end)
+
+    sql = f"""
+        SELECT g.sl_no, g.device, g.event, g.tracking_date, g.battery_voltage
+        FROM gps_data g
+        WHERE {' AND '.join(clauses)}
+        ORDER BY g.device, g.tracking_date
+    """
+    return sql, params
+
+
+def _export_batches(sql, params):
+    """Yield DataFrames of EXPORT_BATCH_ROWS rows straight off a SQLite cursor."""
+    import pandas as pd
+    conn = connect_db(readonly=True)
+    try:
+        for batch in pd.read_sql_query(sql, conn, params=params,
+                                       chunksize=current_app.config['EXPORT_BATCH_ROWS']):
+            batch['tracking_date'] = from_epoch(batch['tracking_date'])
+            yield batch
+    finally:
+        conn.close()
+
+
+def iter_export_csv(sql, params):
+    yield ','.join(EXPORT_COLUMNS) + '\n'
+    for batch in _export_batches(sql, params):
+        yield batch.to_csv(header=False, index=False, date_format='%Y-%m-%d %H:%M:%S')
+
+
+class _StreamSink(io.RawIOBase):
+    """Write-only file object whose contents are drained after every row group."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_export_parquet(sql, params):
+    """Stream a Parquet file, one row group per batch (needs pyarrow)."""
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('sl_no', pa.int64()),
+        ('device', pa.string()),
+        ('event', pa.string()),
+        ('tracking_date', pa.timestamp('s')),
+        ('battery_voltage', pa.float64()),
+    ])
+    sink = _StreamSink()
+    with pq.ParquetWriter(sink, schema, compression='snappy') as writer:
+        for batch in _export_batches(sql, params):
+            batch['sl_no'] = pd.to_numeric(batch['sl_no'], errors='coerce').astype('Int64')
+            writer.write_table(pa.Table.from_pandas(batch, schema=schema, preserve_index=False))
+            yield sink.drain()
+    yield sink.drain()
+
+
+# -------------------------
+# Result cache
+# -------------------------
+class ResultCache:
+    """Thread-safe LRU cache bounded by the approximate size of its values."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+
+# -------------------------
+# Metrics
+# -------------------------
+# Per-process metrics in the Prometheus text format (no client library needed).
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            counts, total, count = self._series.get(labels, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._series[labels] = (counts, total + value, count + 1)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                label_str = ','.join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+                for bound, n in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{label_str},le="{bound}"}} {n}')
+                lines.append(f'{self.name}_bucket{{{label_str},le="+Inf"}} {count}')
+                lines.append(f'{self.name}_sum{{{label_str}}} {total}')
+                lines.append(f'{self.name}_count{{{label_str}}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                label_str = ','.join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+                lines.append(f'{self.name}{{{label_str}}} {value}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram('tracker_request_seconds', 'Request latency by endpoint.', ('endpoint',))
+STAGE_SECONDS = Histogram('tracker_stage_seconds', 'Time per request stage.', ('endpoint', 'stage'))
+ROWS_READ = Counter('tracker_rows_read_total', 'Raw gps rows read to answer requests.', ('endpoint',))
+BYTES_RENDERED = Counter('tracker_bytes_rendered_total', 'Response bytes rendered.', ('endpoint',))
+
+
+@contextmanager
+def stage_timer(stage):
+    """Time a stage of the current request (no-op outside a request)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context():
+            elapsed = time.perf_counter() - started
+            g.setdefault('timings', []).append((stage, elapsed))
+            STAGE_SECONDS.observe((request.endpoint or 'unknown', stage), elapsed)
+
+
+def count_rows(n):
+    if has_request_context():
+        ROWS_READ.inc((request.endpoint or 'unknown',), n)
+
+
+@bp.before_app_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@bp.after_app_request
+def _record_request_metrics(response):
+    endpoint = request.endpoint or 'unknown'
+    if endpoint == 'main.metrics':
+        return response
+    elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+    REQUEST_SECONDS.observe((endpoint,), elapsed)
+    if not response.is_streamed:
+        BYTES_RENDERED.inc((endpoint,), response.calculate_content_length() or 0)
+    if current_app.config['SERVER_TIMING']:
+        timings = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in g.get('timings', [])]
+        timings.append(f"total;dur={elapsed * 1000:.1f}")
+        response.headers['Server-Timing'] = ', '.join(timings)
+    return response
+
+
 # -------------------------
 # Routes
 # -------------------------
-@app.route('/')
+@bp.route('/')
 def landing():
-    return render_template_string(LANDING_TEMPLATE)
+    return render_template('landing.html')
+
+
+def tracker_result(device, start, end, points=None, downsample=None):
+    """Build the /tracker result dict and chart HTML for ``device`` over [start, end] (epoch)."""
+    import pandas as pd
+    try:
+        with get_db(readonly=True) as conn:
+            with stage_timer("sql"):
+                df = read_voltage_history(conn, device, start, end)
+            count_rows(len(df))
+
+            # charge cycles and ping counts are materialized at ingest
+            with stage_timer("charges"):
+                charges = load_charge_events(conn, device, start, end)
+            with stage_timer("rollup"):
+                ping_counts = load_daily_pings(conn, device, start, end)
+
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT region, branch FROM device_info WHERE device = ?",
+                (device,)
+            )
+            info = cur.fetchone()
+    except sqlite3.OperationalError:
+        df = pd.DataFrame()
+        charges = []
+        ping_counts = pd.Series(dtype='int64')
+        info = None
+
+    result = {
+        "device": device,
+        "pings": int(ping_counts.sum()),
+        "charges": len(charges),
+        "charge_details": charges,
+        "long_offline_count": sum(1 for c in charges if c["is_long_offline"])
+    }
 
+    if info:
+        result["region"], result["branch"] = info
 
-@app.route("/tracker", methods=["GET", "POST"])
+    with stage_timer("chart"):
+        combined_chart = create_combined_chart(
+            ping_counts, charges, df,
+            max_points=points,
+            downsample=downsample
+        )
+    return result, combined_chart
+
+
+def compare_result(devices, start, end, points=None, downsample=None):
+    """Build the /tracker/compare summary rows and overlaid chart for ``devices`` over [start, end].
+
+    Reads the same tiers as ``tracker_result``: voltage traces across the
+    retention rollups and the charge cycles stored at ingest.
+    """
+    import pandas as pd
+    with get_db(readonly=True) as conn:
+        with stage_timer("sql"):
+            frames = {device: read_voltage_history(conn, device, start, end) for device in devices}
+        count_rows(sum(len(df) for df in frames.values()))
+        with stage_timer("charges"):
+            charges = {device: load_charge_events(conn, device, start, end) for device in devices}
+        with stage_timer("rollup"):
+            pings = load_daily_pings_many(conn, devices, start, end)
+        placement = dict(
+            (device, (region, branch)) for device, region, branch in conn.execute(
+                f"SELECT device, region, branch FROM device_info WHERE device IN ({', '.join('?' * len(devices))})",
+                devices
+            )
+        )
+
+    rows, series = [], []
+    for device in devices:
+        df = frames[device]
+        cycles = charges[device]
+        ping_counts = pings.get(device, pd.Series(dtype='int64'))
+        region, branch = placement.get(device, (None, None))
+        rows.append({
+            "device": device,
+            "region": region,
+            "branch": branch,
+            "rows": len(df),
+            "pings": int(ping_counts.sum()),
+            "charges": len(cycles),
+            "long_offline_count": sum(1 for c in cycles if c["is_long_offline"])
+        })
+        series.append({"device": device, "ping_counts": ping_counts, "charges": cycles, "voltage": df})
+
+    with stage_timer("chart"):
+        chart = create_comparison_chart(series, max_points=points, downsample=downsample)
+    return rows, chart
+
+
+def chart_points(value):
+    """Voltage trace budget for a ``?points=`` value: CHART_MAX_POINTS unless a positive value lowers it."""
+    limit = current_app.config['CHART_MAX_POINTS']
+    if value is None or value <= 0:
+        return limit
+    return min(value, limit)
+
+
+@bp.route("/tracker", methods=["GET", "POST"])
 def tracker():
+    import pandas as pd
     if request.method == "POST":
-      return redirect(url_for("tracker"))
+      return redirect(url_for(".tracker"))
 
     result = None
     combined_chart = None
@@ -865,128 +3272,504 @@ def tracker():
         from_date = pd.to_datetime(from_raw, dayfirst=True).strftime("%Y-%m-%d")
         to_date = pd.to_datetime(to_raw, dayfirst=True).strftime("%Y-%m-%d")
 
-        try:
-            with sqlite3.connect(DB_NAME) as conn:
-                df = pd.read_sql_query(
-                    """
-                    SELECT * FROM gps_data
-                    WHERE device = ?
-                      AND tracking_date >= ?
-                      AND tracking_date <= ?
-                    ORDER BY tracking_date
-                    """,
-                    conn,
-                    params=(
-                        device,
-                        from_date + " 00:00:00",
-                        to_date + " 23:59:59"
-                    )
-                )
+        start = epoch_seconds(from_date + " 00:00:00")
+        end = epoch_seconds(to_date + " 23:59:59")
+        points = chart_points(request.args.get("points", type=int))
+        downsample = request.args.get("downsample")
 
-                cur = conn.cursor()
-                cur.execute(
-                    "SELECT region, branch FROM device_info WHERE device = ?",
-                    (device,)
-                )
-                info = cur.fetchone()
-        except sqlite3.OperationalError:
-            df = pd.DataFrame()
-            info = None
+        with stage_timer("cache"):
+            try:
+                with get_db(readonly=True) as conn:
+                    cache_key = (device, start, end, points, downsample, data_version(conn, device))
+            except sqlite3.OperationalError:
+                cache_key = None
+
+            result_cache = current_app.extensions['result_cache']
+            cached = result_cache.get(cache_key) if cache_key else None
+        if cached:
+            result, combined_chart = cached
+            result = dict(result, from_date=from_raw, to_date=to_raw)
+        else:
+            result, combined_chart = tracker_result(device, start, end, points, downsample)
+            result.update(from_date=from_raw, to_date=to_raw)
+            if cache_key:
+                size = len(combined_chart or "") + len(repr(result))
+                result_cache.put(cache_key, (result, combined_chart), size)
+
+    with stage_timer("render"):
+        html = render_template(
+            'tracker.html',
+            result=result,
+            combined_chart=combined_chart,
+            upload_success=upload_success,
+            job_id=request.args.get("job"),
+            device_prefill=device_prefill
+        )
+    response = make_response(html)
+    response.headers["Cache-Control"] = "no-store"
+    return response
 
-        result = {
-            "device": device,
+
+@bp.route("/tracker/compare")
+def tracker_compare():
+    import pandas as pd
+    devices = request.args.getlist("device")
+    devices += [d for value in request.args.getlist("devices") for d in value.split(",")]
+    devices = list(dict.fromkeys(d.strip() for d in devices if d.strip()))
+    region = request.args.get("region") or None
+    branch = request.args.get("branch") or None
+    from_raw = request.args.get("from_date", "")
+    to_raw = request.args.get("to_date", "")
+
+    comparison = None
+    combined_chart = None
+    error = None
+    try:
+        if not from_raw or not to_raw:
+            raise ValueError("missing date")
+        start = epoch_seconds(pd.to_datetime(from_raw, dayfirst=True).normalize())
+        end = epoch_seconds(pd.to_datetime(to_raw, dayfirst=True).normalize()) + 86399
+    except ValueError:
+        error = "Enter a valid from and to date."
+    if not error and not devices and branch:
+        with get_db(readonly=True) as conn:
+            devices = [device for device, _, _ in fleet_devices(conn, region, branch)]
+    limit = current_app.config["COMPARE_MAX_DEVICES"]
+    if not error and not devices:
+        error = "Enter device IDs or a branch to compare."
+    elif not error and len(devices) > limit:
+        error = f"Compare at most {limit} devices at a time ({len(devices)} given)."
+
+    if not error:
+        rows, combined_chart = compare_result(
+            devices, start, end,
+            points=chart_points(request.args.get("points", type=int)),
+            downsample=request.args.get("downsample")
+        )
+        comparison = {
+            "devices": rows,
+            "region": region,
+            "branch": branch,
             "from_date": from_raw,
             "to_date": to_raw,
-            "pings": len(df[df["event"].isin(["G_PING", "REBOOT"])]) if not df.empty else 0,
-            "charges": len(detect_charges(df)) if not df.empty else 0,
-            "charge_details": [],
-            "long_offline_count": 0
         }
 
-        if info:
-            result["region"], result["branch"] = info
-
-    response = make_response(render_template_string(
-        TRACKER_TEMPLATE,
-        result=result,
-        combined_chart=combined_chart,
-        upload_success=upload_success,
-        device_prefill=device_prefill
-    ))
+    with stage_timer("render"):
+        html = render_template(
+            'tracker.html',
+            comparison=comparison,
+            compare_error=error,
+            combined_chart=combined_chart,
+            compare_prefill=",".join(devices) if not branch else "",
+            branch_prefill=branch or "",
+            region_prefill=region or ""
+        )
+    response = make_response(html)
     response.headers["Cache-Control"] = "no-store"
     return response
 
 
-@app.route("/tracker/upload", methods=["POST"])
+@bp.route("/metrics")
+def metrics():
+    lines = []
+    for metric in (REQUEST_SECONDS, STAGE_SECONDS, ROWS_READ, BYTES_RENDERED):
+        lines.extend(metric.render())
+    for key, value in current_app.extensions['result_cache'].stats().items():
+        lines.append(f"# TYPE tracker_result_cache_{key} gauge")
+        lines.append(f"tracker_result_cache_{key} {value}")
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+@bp.route("/tracker/cache")
+def tracker_cache_stats():
+    return jsonify(current_app.extensions['result_cache'].stats())
+
+
+@bp.route("/tracker/upload", methods=["POST"])
 def tracker_upload():
+    import pandas as pd
+    saved = []  # removed again unless a job takes them over
     try:
-        file = request.files.get("file")
-        if not file or file.filename == "":
+        files = [f for f in request.files.getlist("file") if f.filename]
+        if not files:
             raise ValueError("No file selected")
 
-        if not allowed_file(file.filename):
-            raise ValueError("Only CSV allowed")
-
-        filename = secure_filename(f"{uuid.uuid4()}.csv")
-        path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        file.save(path)
+        extensions = current_app.config["UPLOAD_EXTENSIONS"]
+        for file in files:
+            if not allowed_file(file.filename, extensions):
+                raise ValueError(f"Only {', '.join(extensions)} files allowed")
+
+        paths = []
+        with stage_timer("save"):
+            for file in files:
+                ext = ".csv.gz" if file.filename.lower().endswith(".gz") else \
+                    "." + file.filename.rsplit(".", 1)[1].lower()
+                filename = secure_filename(f"{uuid.uuid4()}{ext}")
+                path = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
+                file.save(path)
+                saved.append(path)
+                expanded = expand_upload(path, current_app.config["UPLOAD_FOLDER"])
+                saved.extend(expanded)
+                paths.extend(expanded)
+        if not paths:
+            raise ValueError("No CSV files in the upload")
 
         date_format = request.form.get("date_format", "mmddyyyy")
 
-        preview = pd.read_csv(path, nrows=5)
-        cols = preview.columns.str.lower().str.replace(" ", "_")
+        with stage_timer("sniff"):
+            kinds = set()
+            for path in paths:
+                cols = pd.read_csv(path, nrows=0).columns.str.lower().str.replace(" ", "_")
+                kinds.add("device_info" if {"device_id", "region", "branch"}.issubset(cols) else "gps")
 
-        if {"device_id", "region", "branch"}.issubset(cols):
-            import_device_info(path)
-        else:
-            import_csv(path, date_format)
+        if "device_info" in kinds and len(paths) > 1:
+            raise ValueError("Region files must be uploaded on their own")
+        with stage_timer("queue"):
+            job = submit_ingest(paths, kinds.pop(), date_format)
+        saved = []
 
-        os.remove(path)
-        return redirect("/tracker?upload=success")
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify(job_id=job["id"], status_url=url_for(".tracker_job", job_id=job["id"])), 202
+        return redirect(url_for(".tracker", upload="queued", job=job["id"]))
 
     except Exception as e:
+        for path in saved:
+            if os.path.exists(path):
+                os.remove(path)
         return f"Upload failed: {e}", 400
-    with sqlite3.connect(DB_NAME) as conn:
-      cur = conn.cursor()
-      cur.execute("SELECT COUNT(*) FROM gps_data")
-      print("GPS rows in DB:", cur.fetchone()[0])
 
 
-@app.route("/region-search", methods=["GET", "POST"])
+@bp.route("/tracker/jobs/<job_id>")
+def tracker_job(job_id):
+    job = load_job(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    return jsonify(job)
+
+
+@bp.route("/region-search", methods=["GET", "POST"])
 def region_search():
     upload_success = False
+    upload_counts = None
 
     if request.method == "POST" and "file" in request.files:
         file = request.files["file"]
         if file and allowed_file(file.filename):
             filename = secure_filename(f"{uuid.uuid4()}.csv")
-            path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+            path = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
             file.save(path)
-            import_device_info(path)
+            with stage_timer("import"):
+                upload_counts = import_device_info(path, request.form.get("deactivate_missing") == "on")
             os.remove(path)
             upload_success = True
 
-    with sqlite3.connect(DB_NAME) as conn:
-        df = pd.read_sql_query("SELECT * FROM device_info", conn)
-
-    return render_template_string(
-        REGION_TEMPLATE,
-        upload_success=upload_success,
-        data=df.to_dict("records"),
-        total_devices=len(df),
-        region_count=df["region"].nunique() if not df.empty else 0,
-        regions_with_counts=df.groupby("region")
-        .size()
-        .reset_index(name="count")
-        .to_dict("records")
-        if not df.empty else []
+    # only the summary is rendered; the dropdowns page through /api/*
+    with stage_timer("sql"), get_db(readonly=True) as conn:
+        total_devices = conn.execute("SELECT COUNT(*) FROM device_info WHERE active = 1").fetchone()[0]
+        regions_with_counts = region_counts(conn)
+
+    with stage_timer("render"):
+        return render_template(
+            'region.html',
+            upload_success=upload_success,
+            upload_counts=upload_counts,
+            total_devices=total_devices,
+            region_count=len(regions_with_counts),
+            regions_with_counts=regions_with_counts
+        )
+
+
+def region_counts(conn):
+    rows = conn.execute(
+        """
+        SELECT region, COUNT(*) FROM device_info
+        WHERE region IS NOT NULL AND active = 1
+        GROUP BY region
+        ORDER BY region
+        """
+    ).fetchall()
+    return [{"region": region, "count": count} for region, count in rows]
+
+
+@bp.route("/api/regions")
+def api_regions():
+    with get_db(readonly=True) as conn:
+        return jsonify(region_counts(conn))
+
+
+@bp.route("/api/branches")
+def api_branches():
+    region = request.args.get("region", "")
+    with get_db(readonly=True) as conn:
+        rows = conn.execute(
+            """
+            SELECT branch, COUNT(*) FROM device_info
+            WHERE region = ? AND branch IS NOT NULL AND branch != '' AND active = 1
+            GROUP BY branch
+            ORDER BY branch
+            """,
+            (region,)
+        ).fetchall()
+    return jsonify([{"branch": branch, "count": count} for branch, count in rows])
+
+
+@bp.route("/api/devices")
+def api_devices():
+    region = request.args.get("region", "")
+    branch = request.args.get("branch", "")
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = min(max(request.args.get("per_page", 100, type=int), 1), 1000)
+
+    with get_db(readonly=True) as conn:
+        total = conn.execute(
+            "SELECT COUNT(*) FROM device_info WHERE branch = ? AND region = ? AND active = 1",
+            (branch, region)
+        ).fetchone()[0]
+        rows = conn.execute(
+            """
+            SELECT device, sim_type FROM device_info
+            WHERE branch = ? AND region = ? AND active = 1
+            ORDER BY device
+            LIMIT ? OFFSET ?
+            """,
+            (branch, region, per_page, (page - 1) * per_page)
+        ).fetchall()
+
+    return jsonify(
+        devices=[{"device": device, "sim_type": sim_type} for device, sim_type in rows],
+        page=page,
+        per_page=per_page,
+        total=total
     )
 
 
+def _series_time(value, end=False):
+    """Epoch seconds, or a dd/mm/yyyy[ HH:MM[:SS]] date (a bare ``end`` date covers the whole day)."""
+    import pandas as pd
+    if value.lstrip("-").isdigit():
+        return int(value)
+    ts = epoch_seconds(pd.to_datetime(value, dayfirst=True))
+    return ts + 86399 if end and ":" not in value else ts
+
+
+@bp.route("/api/devices/<device>/series")
+def api_device_series(device):
+    resolution = request.args.get("resolution", "hour")
+    if resolution not in SERIES_RESOLUTIONS:
+        return jsonify(error=f"resolution must be one of {', '.join(SERIES_RESOLUTIONS)}"), 400
+    try:
+        start = _series_time(request.args["from"])
+        end = _series_time(request.args["to"], end=True)
+    except KeyError:
+        return jsonify(error="from and to are required"), 400
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    limit = current_app.config["SERIES_MAX_POINTS"]
+    with stage_timer("sql"), get_db(readonly=True) as conn:
+        series = device_series(conn, device, start, end, resolution, limit)
+    if series is None:
+        return jsonify(error=f"more than {limit} points; use a coarser resolution or a shorter range"), 400
+    count_rows(sum(series["count"]) if "count" in series else len(series["t"]))
+
+    return jsonify(device=device, resolution=resolution, bucket_seconds=SERIES_RESOLUTIONS[resolution],
+                   **{"from": start, "to": end}, **series)
+
+
+@bp.route("/fleet-report")
+def fleet_report():
+    import pandas as pd
+    region = request.args.get("region") or None
+    branch = request.args.get("branch") or None
+    if not region and not branch:
+        return jsonify(error="region or branch is required"), 400
+    try:
+        start = epoch_seconds(pd.to_datetime(request.args["from_date"], dayfirst=True).normalize())
+        end = epoch_seconds(pd.to_datetime(request.args["to_date"], dayfirst=True).normalize()) + 86399
+    except (KeyError, ValueError) as e:
+        return jsonify(error=f"Invalid date range: {e}"), 400
+
+    report = analyze_fleet(start, end, region, branch)
+    report.update(from_date=request.args["from_date"], to_date=request.args["to_date"])
+    return jsonify(report)
+
+
+@bp.route("/fleet-status")
+def fleet_status_view():
+    region = request.args.get("region") or None
+    branch = request.args.get("branch") or None
+    if not region and not branch:
+        return jsonify(error="region or branch is required"), 400
+    status = request.args.get("status", "attention")
+    if status not in STATUS_FILTERS:
+        return jsonify(error=f"status must be one of {', '.join(STATUS_FILTERS)}"), 400
+    offline_hours = request.args.get("offline_hours", current_app.config["STATUS_OFFLINE_HOURS"], type=float)
+    low_voltage = request.args.get("low_voltage", current_app.config["STATUS_LOW_VOLTAGE"], type=float)
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = min(max(request.args.get("per_page", 100, type=int), 1), 1000)
+
+    now = now_epoch()
+    offline_before = now - int(offline_hours * 3600)
+    with stage_timer("sql"), get_db(readonly=True) as conn:
+        summary, rows = fleet_status(conn, region, branch, status, offline_before, low_voltage,
+                                     limit=per_page, offset=(page - 1) * per_page)
+    count_rows(len(rows))
+
+    devices = [
+        {
+            "device": device,
+            "region": dev_region,
+            "branch": dev_branch,
+            "last_seen": last_seen,
+            "last_voltage": last_voltage,
+            "last_event": last_event,
+            "ping_count": ping_count,
+            "hours_silent": None if last_seen is None else round((now - last_seen) / 3600, 1),
+            "offline": last_seen is None or last_seen < offline_before,
+            "low_voltage": last_voltage is not None and last_voltage < low_voltage,
+        }
+        for device, dev_region, dev_branch, last_seen, last_voltage, last_event, ping_count in rows
+    ]
+    return jsonify(dict(summary, region=region, branch=branch, status=status, at=now,
+                        offline_hours=offline_hours, low_voltage_below=low_voltage,
+                        page=page, per_page=per_page, devices=devices))
+
+
+@bp.route("/export")
+def export():
+    import pandas as pd
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "parquet"):
+        return jsonify(error="format must be csv or parquet"), 400
+
+    devices = request.args.getlist("device")
+    devices += [d for value in request.args.getlist("devices") for d in value.split(",")]
+    devices = [d.strip() for d in devices if d.strip()]
+    try:
+        start = end = None
+        if request.args.get("from_date"):
+            start = epoch_seconds(pd.to_datetime(request.args["from_date"], dayfirst=True).normalize())
+        if request.args.get("to_date"):
+            end = epoch_seconds(pd.to_datetime(request.args["to_date"], dayfirst=True).normalize()) + 86399
+        sql, params = export_query(devices, request.args.get("region"), request.args.get("branch"), start, end)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            return jsonify(error="Parquet export requires pyarrow"), 501
+        body, mimetype = iter_export_parquet(sql, params), "application/vnd.apache.parquet"
+    else:
+        body, mimetype = iter_export_csv(sql, params), "text/csv"
+
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename=gps_export.{fmt}"
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
 # =====================================================
 # App start
 # =====================================================
 
-if __name__ == "__main__":
+@bp.cli.command('init-db')
+def init_db_command():
+    """Create the schema or migrate an existing gps_data.db to the current version."""
     create_tables()
+    print(f"{current_app.config['DATABASE']} is at schema v{SCHEMA_VERSION}")
+
+
+@bp.cli.command('dedupe-db')
+def dedupe_db_command():
+    """Remove duplicate gps_data rows, rebuild rollups and compact the database."""
+    create_tables()
+    with get_db() as conn:
+        removed = dedupe_gps_data(conn)
+    get_db().execute('VACUUM')
+    print(f"Removed {removed} duplicate rows; {current_app.config['DATABASE']} compacted")
+
+
+@bp.cli.command('fleet-report')
+@click.option('--region')
+@click.option('--branch')
+@click.option('--from', 'from_date', required=True, help='dd/mm/yyyy')
+@click.option('--to', 'to_date', required=True, help='dd/mm/yyyy')
+@click.option('--workers', type=int, help='worker processes (default: one per core)')
+@click.option('--output', type=click.File('w'), default='-', help='JSON output file')
+def fleet_report_command(region, branch, from_date, to_date, workers, output):
+    """Charge counts, long-offline periods and average charge durations per device."""
+    import pandas as pd
+    start = epoch_seconds(pd.to_datetime(from_date, dayfirst=True).normalize())
+    end = epoch_seconds(pd.to_datetime(to_date, dayfirst=True).normalize()) + 86399
+    started = time.monotonic()
+    report = analyze_fleet(start, end, region, branch, workers)
+    report.update(from_date=from_date, to_date=to_date)
+    json.dump(report, output, indent=2, default=str)
+    output.write("\n")
+    click.echo(f"{report['devices']} devices analysed in {time.monotonic() - started:.1f}s", err=True)
+
+
+@bp.cli.command('parquet-backfill')
+def parquet_backfill_command():
+    """Mirror existing gps_data rows into the Parquet store."""
+    create_tables()
+    written = backfill_parquet(get_db())
+    print(f"Wrote {written} rows under {current_app.config['PARQUET_ROOT']}")
+
+
+@bp.cli.command('parquet-compact')
+def parquet_compact_command():
+    """Merge each Parquet month/bucket partition into a single file."""
+    create_tables()
+    removed = compact_parquet(get_db())
+    print(f"Compacted {removed} files under {current_app.config['PARQUET_ROOT']}")
+
+
+@bp.cli.command('retention')
+@click.option('--raw-days', type=int, help='keep raw pings this many days (default RETENTION_RAW_DAYS)')
+@click.option('--hourly-days', type=int, help='keep hourly rows this many days (default RETENTION_HOURLY_DAYS)')
+@click.option('--vacuum-full', is_flag=True,
+              help='rewrite the database once to switch it to incremental auto-vacuum')
+def retention_command(raw_days, hourly_days, vacuum_full):
+    """Roll old raw pings into hourly/daily aggregates and reclaim the space."""
+    stats = run_retention(raw_days=raw_days, hourly_days=hourly_days)
+    print(json.dumps(stats))
+    if vacuum_full:
+        conn = get_db()
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        print(f"{current_app.config['DATABASE']} compacted (auto_vacuum = INCREMENTAL)")
+
+
+def create_app(config=None):
+    """Build the Flask app.
+
+    Settings come from DEFAULT_CONFIG, then the file named by
+    $ASSET_TRACKER_SETTINGS (if set), then ``config``. Serve with
+    ``gunicorn 'app:create_app()'`` or ``flask --app app run``.
+    """
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    app.config.from_envvar('ASSET_TRACKER_SETTINGS', silent=True)
+    if config:
+        app.config.update(config)
+    if app.config['JOBS_FOLDER'] is None:
+        app.config['JOBS_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'jobs')
+    os.makedirs(app.config['JOBS_FOLDER'], exist_ok=True)
+
+    app.jinja_loader = DictLoader(TEMPLATES)
+    app.register_blueprint(bp)
+    app.extensions['result_cache'] = ResultCache(app.config['RESULT_CACHE_BYTES'])
+    app.extensions['ingest_executor'] = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest')
+    if app.config['RETENTION_INTERVAL_HOURS']:
+        start_retention_scheduler(app)
+    return app
+
+
+if __name__ == "__main__":
+    app = create_app()
+    with app.app_context():
+        create_tables()
     app.run(debug=True)
\ No newline at end of file
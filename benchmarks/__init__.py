@@ -0,0 +1,7 @@
+"""Benchmarks for the asset tracker.
+
+    python -m benchmarks.generate --rows 1000000 --devices 200 --out fleet.csv
+    python -m benchmarks.run --rows 100000 1000000 --output results.json
+    python -m benchmarks.startup --output startup.json
+    python -m benchmarks.compare baseline.json results.json
+"""
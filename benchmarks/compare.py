@@ -0,0 +1,64 @@
+"""Compare two benchmark result files (baseline first) and flag regressions."""
+
+import argparse
+import json
+import sys
+
+
+# metric -> True when lower is better
+METRICS = {
+    ('latency_ms', 'p50'): True,
+    ('latency_ms', 'p99'): True,
+    ('throughput_per_sec',): False,
+    ('peak_rss_mb',): True,
+    ('alloc_peak_mb',): True,
+    ('frame_mb',): True,
+}
+
+
+def _get(result, path):
+    for key in path:
+        result = result.get(key) if isinstance(result, dict) else None
+    return result
+
+
+def compare(baseline, current, threshold=0.10):
+    """Rows of (benchmark, rows, metric, old, new, change, regressed)."""
+    old = {(r['benchmark'], r['rows']): r for r in baseline['results']}
+    rows = []
+    for result in current['results']:
+        key = (result['benchmark'], result['rows'])
+        if key not in old:
+            continue
+        for path, lower_is_better in METRICS.items():
+            before, after = _get(old[key], path), _get(result, path)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            regressed = change > threshold if lower_is_better else change < -threshold
+            rows.append((*key, '.'.join(path), before, after, change, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative change counted as a regression (default 0.10)')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    rows = compare(baseline, current, args.threshold)
+    for name, size, metric, before, after, change, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{name:24s} {size:>11d} {metric:20s} {before:14.2f} -> {after:14.2f} {change:+8.1%}{flag}")
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
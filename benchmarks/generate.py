@@ -0,0 +1,121 @@
+"""Deterministic synthetic fleet data in the same CSV layout as real exports."""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+
+DATE_FORMATS = {
+    'mmddyyyy': '%m/%d/%Y %I:%M:%S %p',
+    'ddmmyyyy': '%d/%m/%Y %H:%M:%S',
+}
+
+EVENTS = np.array(['G_PING', 'REBOOT', 'IGN_ON', 'IGN_OFF'])
+EVENT_WEIGHTS = [0.85, 0.03, 0.06, 0.06]
+
+BLOCK_ROWS = 1_000_000
+
+
+def device_name(i):
+    return f"DEV{i:06d}"
+
+
+def _device_frame(rng, device, first_sl, start, n, ping_minutes, charge_hours, offline_rate, phase):
+    """``n`` rows for one device: jittered pings, a sawtooth battery and offline gaps."""
+    step = rng.exponential(ping_minutes * 60, n).astype('int64') + 30
+    # occasional multi-day silences (long offline periods)
+    gaps = rng.random(n) < offline_rate
+    step[gaps] += rng.integers(2 * 86400, 5 * 86400, gaps.sum())
+    seconds = start + np.cumsum(step)
+
+    # a charge every charge_hours (per-device phase): 2h linear ramp, then a slow drain
+    period = charge_hours * 3600
+    since = (seconds + phase) % period
+    ramp = 2 * 3600
+    charging = since < ramp
+    voltage = np.where(
+        charging,
+        3.55 + 0.6 * since / ramp,
+        4.15 - 0.6 * (since - ramp) / max(period - ramp, 1)
+    )
+    voltage = np.round(np.clip(voltage + rng.normal(0, 0.01, n), 3.0, 4.25), 2)
+
+    return pd.DataFrame({
+        'Sl. No': np.arange(first_sl, first_sl + n),
+        'Device ID': device,
+        'Event Type': rng.choice(EVENTS, n, p=EVENT_WEIGHTS),
+        'Tracking Date Time': pd.to_datetime(seconds, unit='s'),
+        'Battery Voltage': voltage,
+    }), int(seconds[-1])
+
+
+def generate_fleet_csv(path, rows, devices=100, start='2024-01-01', ping_minutes=10,
+                       charge_hours=24, offline_rate=0.0005, date_format='mmddyyyy', seed=0):
+    """Write ``rows`` GPS rows spread over ``devices`` devices to ``path``.
+
+    Output is identical for identical arguments. Rows are produced in blocks
+    so memory stays flat at any size.
+    """
+    fmt = DATE_FORMATS[date_format]
+    start_s = int(pd.Timestamp(start).timestamp())
+    per_device, extra = divmod(rows, devices)
+    header = True
+    sl_no = 1
+    with open(path, 'w', newline='') as f:
+        for i in range(devices):
+            rng = np.random.default_rng([seed, i])
+            remaining = per_device + (1 if i < extra else 0)
+            clock = start_s
+            phase = int(rng.integers(0, charge_hours * 3600))
+            while remaining > 0:
+                n = min(remaining, BLOCK_ROWS)
+                df, clock = _device_frame(rng, device_name(i), sl_no, clock, n,
+                                          ping_minutes, charge_hours, offline_rate, phase)
+                df['Tracking Date Time'] = df['Tracking Date Time'].dt.strftime(fmt)
+                df.to_csv(f, header=header, index=False)
+                header = False
+                sl_no += n
+                remaining -= n
+    return path
+
+
+def generate_device_info_csv(path, devices=100, regions=5, branches_per_region=4, seed=0):
+    """Write device metadata (Device ID, Region, Branch, SIM Type) for ``devices`` devices."""
+    rng = np.random.default_rng(seed)
+    region = rng.integers(0, regions, devices)
+    branch = rng.integers(0, branches_per_region, devices)
+    pd.DataFrame({
+        'Device ID': [device_name(i) for i in range(devices)],
+        'Region': [f"REGION-{r}" for r in region],
+        'Branch': [f"BRANCH-{r}-{b}" for r, b in zip(region, branch)],
+        'SIM Type': rng.choice(['AIRTEL', 'JIO', 'VI'], devices),
+    }).to_csv(path, index=False)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--start', default='2024-01-01')
+    parser.add_argument('--ping-minutes', type=float, default=10)
+    parser.add_argument('--charge-hours', type=int, default=24)
+    parser.add_argument('--offline-rate', type=float, default=0.0005,
+                        help='probability that a ping follows a 2-5 day silence')
+    parser.add_argument('--date-format', choices=sorted(DATE_FORMATS), default='mmddyyyy')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='fleet.csv')
+    parser.add_argument('--device-info', help='also write device metadata to this path')
+    args = parser.parse_args(argv)
+
+    generate_fleet_csv(args.out, args.rows, args.devices, args.start, args.ping_minutes,
+                       args.charge_hours, args.offline_rate, args.date_format, args.seed)
+    if args.device_info:
+        generate_device_info_csv(args.device_info, args.devices, seed=args.seed)
+    print(f"{args.rows} rows -> {os.path.abspath(args.out)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""Run the app benchmarks at one or more data sizes and write JSON results.
+
+Each benchmark runs in a fresh process so its peak RSS is its own.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.generate import device_name, generate_device_info_csv, generate_fleet_csv
+
+
+BENCHMARKS = ['import_device_info', 'import_csv', 'tracker_query', 'tracker_query_cached',
+              'device_range_read', 'detect_charges', 'create_combined_chart']
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _latency(samples):
+    ms = np.array(samples) * 1000
+    return {f"p{q}": float(np.percentile(ms, q)) for q in (50, 90, 99)} | {'mean': float(ms.mean())}
+
+
+def _timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _load_app(workdir):
+    import app
+    flask_app = app.create_app({
+        'DATABASE': os.path.join(workdir, 'bench.db'),
+        'UPLOAD_FOLDER': workdir,
+        'PARQUET_ROOT': os.path.join(workdir, 'parquet'),
+    })
+    flask_app.app_context().push()
+    return app, flask_app
+
+
+def _device_range(app, device):
+    with app.get_db(readonly=True) as conn:
+        lo, hi = conn.execute(
+            "SELECT MIN(tracking_date), MAX(tracking_date) FROM gps_data WHERE device = ?", (device,)
+        ).fetchone()
+    return lo, hi
+
+
+@contextmanager
+def _workdir(root, rows):
+    """A temporary directory, or ``root``/rows_<rows> kept after the run (stale databases removed)."""
+    if root is None:
+        with tempfile.TemporaryDirectory() as workdir:
+            yield workdir
+        return
+    workdir = os.path.join(root, f'rows_{rows}')
+    os.makedirs(workdir, exist_ok=True)
+    for name in os.listdir(workdir):
+        if name.startswith('bench.db'):
+            os.remove(os.path.join(workdir, name))
+    shutil.rmtree(os.path.join(workdir, 'parquet'), ignore_errors=True)
+    yield workdir
+
+
+def _case(name, workdir, rows, repeat, date_format='mmddyyyy'):
+    """Run one benchmark (inside a worker process) and return its metrics."""
+    app, flask_app = _load_app(workdir)
+    device = device_name(0)
+    result = {'benchmark': name, 'rows': rows}
+
+    if name == 'import_device_info':
+        samples = _timed(lambda: app.import_device_info(os.path.join(workdir, 'device_info.csv')), 1)
+        result['items'] = sum(1 for _ in open(os.path.join(workdir, 'device_info.csv'))) - 1
+    elif name == 'import_csv':
+        samples = _timed(lambda: app.import_csv(os.path.join(workdir, 'fleet.csv'), date_format), 1)
+        result['items'] = rows
+    elif name in ('tracker_query', 'tracker_query_cached'):
+        lo, hi = _device_range(app, device)
+        url = (f"/tracker?device={device}"
+               f"&from_date={app.from_epoch([lo])[0]:%d/%m/%Y}&to_date={app.from_epoch([hi])[0]:%d/%m/%Y}")
+        client = flask_app.test_client()
+        cached = name == 'tracker_query_cached'
+        client.get(url)
+
+        def query():
+            if not cached:
+                flask_app.extensions['result_cache'].clear()
+            response = client.get(url)
+            assert response.status_code == 200, response.status_code
+            result['bytes'] = len(response.data)
+        samples = _timed(query, repeat)
+        result['items'] = 1
+    elif name == 'device_range_read':
+        # every device's full history in one pass, as /tracker/compare reads it
+        with app.get_db(readonly=True) as conn:
+            devices = [d for (d,) in conn.execute("SELECT DISTINCT device FROM gps_data")]
+            lo, hi = conn.execute("SELECT MIN(tracking_date), MAX(tracking_date) FROM gps_data").fetchone()
+            frames = {}
+            # peak RSS is mostly SQLite's mmap and page cache here; tracemalloc sees the frames
+            tracemalloc.start()
+            samples = _timed(lambda: frames.update(app.iter_devices_rows(conn, devices, lo, hi)), 1)
+            result['alloc_peak_mb'] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+        result['items'] = sum(len(df) for df in frames.values())
+        result['frame_mb'] = sum(df.memory_usage(deep=True).sum() for df in frames.values()) / (1024 * 1024)
+    else:
+        lo, hi = _device_range(app, device)
+        with app.get_db(readonly=True) as conn:
+            df = app.read_gps_rows(conn, device, lo, hi)
+            charges = app.load_charge_events(conn, device, lo, hi)
+            pings = app.load_daily_pings(conn, device, lo, hi)
+        result['items'] = len(df)
+        if name == 'detect_charges':
+            samples = _timed(lambda: app.detect_charges(df), repeat)
+        else:
+            samples = _timed(lambda: app.create_combined_chart(pings, charges, df), repeat)
+
+    result['seconds'] = float(sum(samples))
+    result['latency_ms'] = _latency(samples)
+    result['throughput_per_sec'] = result['items'] / (sum(samples) / len(samples)) if sum(samples) else None
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def run_case(name, workdir, rows, repeat, date_format='mmddyyyy'):
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(_case, name, workdir, rows, repeat, date_format).result()
+
+
+def _meta():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000],
+                        help='data sizes to run (e.g. 100000 1000000 10000000)')
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20, help='iterations for latency benchmarks')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument('--date-format', choices=['mmddyyyy', 'ddmmyyyy'], default='mmddyyyy')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help='keep generated data (and the databases) under this directory '
+                                          'instead of a temp dir')
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args(argv)
+
+    results = []
+    for rows in args.rows:
+        with _workdir(args.workdir, rows) as workdir:
+            generate_fleet_csv(os.path.join(workdir, 'fleet.csv'), rows, args.devices,
+                               date_format=args.date_format, seed=args.seed)
+            generate_device_info_csv(os.path.join(workdir, 'device_info.csv'), args.devices, seed=args.seed)
+            # the import benchmarks always run: later benchmarks query the database they build
+            setup = ['import_device_info', 'import_csv']
+            for name in setup + [b for b in BENCHMARKS if b in args.only and b not in setup]:
+                result = run_case(name, workdir, rows, args.repeat, args.date_format)
+                results.append(result)
+                print(f"{name:24s} rows={rows:<11d} p50={result['latency_ms']['p50']:10.2f} ms  "
+                      f"throughput={result['throughput_per_sec'] or 0:14.1f}/s  "
+                      f"peak_rss={result['peak_rss_mb']:8.1f} MB", flush=True)
+
+    with open(args.output, 'w') as f:
+        json.dump({'meta': _meta(), 'config': vars(args), 'results': results}, f, indent=2)
+    print(f"results -> {os.path.abspath(args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Cold-start benchmark: wall time of fresh interpreters importing and serving the app.
+
+Each case runs in a new ``python`` process (repeated ``--repeat`` times) and
+records which heavy libraries it ended up importing, so a stray module-level
+import shows up in the results as well as in the timings. The output uses
+the same layout as ``benchmarks.run``, so ``benchmarks.compare`` works on it.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.run import _latency, _meta
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['numpy', 'pandas', 'plotly', 'pyarrow']
+
+# name -> code run in the fresh interpreter (``app`` settings come from $ASSET_TRACKER_SETTINGS)
+CASES = {
+    'startup_import': "import app",
+    'startup_create_app': "import app; app.create_app()",
+    'startup_landing': (
+        "import app; client = app.create_app().test_client(); "
+        "assert client.get('/').status_code == 200"
+    ),
+    'startup_region_search': (
+        "import app; client = app.create_app().test_client(); "
+        "assert client.get('/region-search').status_code == 200"
+    ),
+    'startup_cli_init_db': (
+        "from flask.cli import main\n"
+        "try:\n    main()\n"
+        "except SystemExit as e:\n    assert not e.code, e.code"
+    ),
+}
+
+REPORT = (
+    "import json, resource, sys; "
+    "peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss; "
+    "print(json.dumps({'peak_rss_mb': peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, "
+    "'modules': [m for m in %r if m in sys.modules]}))"
+)
+
+
+def _run_once(name, env):
+    argv = [sys.executable, '-c', f"{CASES[name]}\n{REPORT % HEAVY_MODULES}"]
+    if name == 'startup_cli_init_db':
+        argv += ['--app', 'app:create_app()', 'init-db']
+    started = time.perf_counter()
+    proc = subprocess.run(argv, env=env, cwd=REPO_ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if proc.returncode:
+        raise RuntimeError(f"{name} failed:\n{proc.stderr}")
+    return elapsed, json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run_case(name, workdir, repeat):
+    settings = os.path.join(workdir, 'settings.py')
+    with open(settings, 'w') as f:
+        f.write(f"DATABASE = {os.path.join(workdir, 'startup.db')!r}\n"
+                f"UPLOAD_FOLDER = {workdir!r}\n")
+    env = dict(os.environ, ASSET_TRACKER_SETTINGS=settings,
+               PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+
+    # the first run creates the schema and warms the OS file cache
+    _run_once('startup_cli_init_db', env)
+    samples, report = [], None
+    for _ in range(repeat):
+        elapsed, report = _run_once(name, env)
+        samples.append(elapsed)
+    return {
+        'benchmark': name,
+        'rows': 0,
+        'items': 1,
+        'seconds': float(sum(samples)),
+        'latency_ms': _latency(samples),
+        'throughput_per_sec': len(samples) / sum(samples),
+        'peak_rss_mb': report['peak_rss_mb'],
+        'modules': report['modules'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=10, help='fresh processes per case')
+    parser.add_argument('--only', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--output', default='startup_results.json')
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.only:
+            result = run_case(name, workdir, args.repeat)
+            results.append(result)
+            print(f"{name:24s} p50={result['latency_ms']['p50']:8.1f} ms  "
+                  f"peak_rss={result['peak_rss_mb']:7.1f} MB  "
+                  f"heavy={','.join(result['modules']) or '-'}", flush=True)
+
+    with open(args.output, 'w') as f:
+        json.dump({'meta': _meta(), 'config': vars(args), 'results': results}, f, indent=2)
+    print(f"results -> {os.path.abspath(args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as tracker  # noqa: E402
+
+
+@pytest.fixture
+def flask_app(tmp_path):
+    flask_app = tracker.create_app({
+        'DATABASE': str(tmp_path / 'test.db'),
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'PARQUET_ROOT': str(tmp_path / 'parquet'),
+    })
+    with flask_app.app_context():
+        yield flask_app
+    tracker.close_db()
@@ -0,0 +1,140 @@
+"""charge_cycles/detect_charges against the original row-by-row loop."""
+
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as tracker
+
+
+def reference_detect_charges(df, rise_threshold=0.15, window=3):
+    """The original detect_charges loop, kept verbatim as the behavioural reference."""
+    if df.empty:
+        return []
+
+    df = df.sort_values('tracking_date').reset_index(drop=True)
+    voltages = df['battery_voltage'].tolist()
+    timestamps = df['tracking_date'].tolist()
+    raw_charges = []
+    i = 0
+
+    while i < len(voltages) - window:
+        start_voltage = voltages[i]
+        end_voltage = voltages[i + window]
+
+        if pd.notna(start_voltage) and pd.notna(end_voltage) and end_voltage - start_voltage >= rise_threshold:
+            window_slice = voltages[i:i+window+1]
+            max_voltage = max(window_slice)
+            max_index = i + window_slice.index(max_voltage)
+
+            start_time = timestamps[i]
+            end_time = timestamps[max_index]
+            charge_duration = end_time - start_time
+            days_offline = charge_duration.total_seconds() / (24 * 3600)
+
+            raw_charges.append({
+                'start_time_dt': start_time,
+                'end_time_dt': end_time,
+                'date': start_time.date() if hasattr(start_time, 'date') else None,
+                'start_voltage': start_voltage,
+                'max_voltage': max_voltage,
+                'duration': charge_duration,
+                'days_offline': days_offline,
+                'is_long_offline': days_offline >= 2
+            })
+
+            i = max_index
+        else:
+            i += 1
+
+    # Merge nearby events (<60 mins apart)
+    merged_charges = []
+    for charge in raw_charges:
+        if not merged_charges:
+            merged_charges.append(charge)
+            continue
+
+        last = merged_charges[-1]
+        if charge['start_time_dt'] - last['end_time_dt'] <= timedelta(minutes=60):
+            last['end_time_dt'] = max(last['end_time_dt'], charge['end_time_dt'])
+            last['max_voltage'] = max(last.get('max_voltage', 0), charge['max_voltage'])
+            last['start_voltage'] = min(last.get('start_voltage', 9999), charge['start_voltage'])
+            last['duration'] = last['end_time_dt'] - last['start_time_dt']
+            last['days_offline'] = last['duration'].total_seconds() / (24 * 3600)
+            last['is_long_offline'] = last['days_offline'] >= 2
+        else:
+            merged_charges.append(charge)
+
+    # Format for UI
+    for charge in merged_charges:
+        charge['start_time'] = charge['start_time_dt'].strftime('%I:%M:%S %p')
+        charge['end_time'] = charge['end_time_dt'].strftime('%I:%M:%S %p')
+        charge['date'] = charge['start_time_dt'].strftime('%d-%m-%Y')
+
+        total_seconds = charge['duration'].total_seconds()
+        days = int(total_seconds // 86400)
+        hours = int((total_seconds % 86400) // 3600)
+        minutes = int((total_seconds % 3600) // 60)
+        charge['duration'] = f"{days} days {hours} hrs {minutes} mins"
+
+        if charge['is_long_offline']:
+            charge['days_offline'] = f"{days} days {hours} hrs {minutes} mins"
+
+    return merged_charges
+
+
+def random_frame(rng, n, nan_rate=0.0, duplicate_rate=0.0, shuffle=False):
+    """Noisy sawtooth voltages (2 decimals) with irregular gaps, like real exports."""
+    step = rng.exponential(600, n).astype('int64') + 1
+    step[rng.random(n) < 0.01] += 3 * 86400  # multi-day silences
+    step[rng.random(n) < duplicate_rate] = 0
+    times = pd.Timestamp('2024-01-01') + pd.to_timedelta(np.cumsum(step), unit='s')
+    phase = np.arange(n) % rng.integers(20, 80)
+    voltage = np.round(3.4 + 0.04 * np.minimum(phase, 20) + rng.normal(0, 0.04, n), 2)
+    voltage[rng.random(n) < nan_rate] = np.nan
+    df = pd.DataFrame({'tracking_date': times, 'battery_voltage': voltage})
+    return df.sample(frac=1, random_state=int(rng.integers(1 << 31))) if shuffle else df
+
+
+CASES = [
+    dict(nan_rate=0.0, duplicate_rate=0.0, shuffle=False),
+    dict(nan_rate=0.05, duplicate_rate=0.0, shuffle=False),
+    dict(nan_rate=0.0, duplicate_rate=0.05, shuffle=False),
+    dict(nan_rate=0.02, duplicate_rate=0.02, shuffle=True),
+]
+PARAMS = [(0.15, 3), (0.05, 1), (0.1, 2), (0.3, 5)]
+
+
+@pytest.mark.parametrize('case', CASES)
+@pytest.mark.parametrize('rise_threshold,window', PARAMS)
+def test_matches_reference(case, rise_threshold, window):
+    rng = np.random.default_rng(hash((tuple(case.values()), rise_threshold, window)) % (1 << 32))
+    for n in (0, 1, window, window + 1, 50, 500, 3000):
+        df = random_frame(rng, n, **case)
+        expected = reference_detect_charges(df, rise_threshold, window)
+        assert tracker.detect_charges(df, rise_threshold, window) == expected
+        assert len(tracker.charge_cycles(df, rise_threshold, window)) == len(expected)
+
+
+def test_float32_voltages_match_float64():
+    rng = np.random.default_rng(7)
+    df = random_frame(rng, 5000)
+    compact = df.assign(battery_voltage=df['battery_voltage'].astype('float32'))
+    assert tracker.detect_charges(compact) == reference_detect_charges(df)
+
+
+def test_realistic_export(tmp_path):
+    from benchmarks.generate import generate_fleet_csv
+    path = tmp_path / 'fleet.csv'
+    generate_fleet_csv(str(path), 20_000, 2, seed=3)
+    raw = pd.read_csv(path)
+    for _, rows in raw.groupby('Device ID'):
+        df = pd.DataFrame({
+            'tracking_date': pd.to_datetime(rows['Tracking Date Time'], format='%m/%d/%Y %I:%M:%S %p'),
+            'battery_voltage': rows['Battery Voltage'],
+        })
+        expected = reference_detect_charges(df)
+        assert expected
+        assert tracker.detect_charges(df) == expected
@@ -0,0 +1,45 @@
+"""Bulk CSV export."""
+
+import io
+
+import pandas as pd
+import pytest
+
+import app as tracker
+from benchmarks.generate import generate_fleet_csv
+
+
+@pytest.fixture
+def fleet(flask_app, tmp_path):
+    path = tmp_path / 'fleet.csv'
+    generate_fleet_csv(str(path), 8_000, 4, seed=3)
+    tracker.import_csv(str(path))
+    conn = tracker.get_db()
+    with conn:
+        conn.executemany('INSERT INTO device_info (device, region, branch) VALUES (?, ?, ?)', [
+            ('DEV000000', 'North', 'A'), ('DEV000001', 'North', 'B'), ('DEV000002', 'South', 'A'),
+        ])
+    return conn
+
+
+@pytest.mark.parametrize('filters', [
+    dict(region='North'),
+    dict(branch='A'),
+    dict(region='North', branch='B'),
+    dict(devices=['DEV000000', 'DEV000002'], region='North'),
+])
+def test_region_exports_stream_in_index_order(fleet, filters):
+    sql, params = tracker.export_query(start=0, end=2 ** 40, **filters)
+    plan = ' '.join(row[-1] for row in fleet.execute('EXPLAIN QUERY PLAN ' + sql, params))
+    assert 'TEMP B-TREE' not in plan
+
+
+def test_region_export_rows(flask_app, fleet):
+    flask_app.config['EXPORT_BATCH_ROWS'] = 1_000
+    response = flask_app.test_client().get('/export?region=North')
+    exported = pd.read_csv(io.BytesIO(response.data))
+    assert set(exported['device']) == {'DEV000000', 'DEV000001'}
+    assert len(exported) == fleet.execute(
+        "SELECT COUNT(*) FROM gps_data WHERE device IN ('DEV000000', 'DEV000001')"
+    ).fetchone()[0]
+    assert exported.equals(exported.sort_values(['device', 'tracking_date'], kind='stable'))
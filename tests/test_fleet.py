@@ -0,0 +1,33 @@
+"""Fleet report process pool."""
+
+import app as tracker
+
+
+def test_workers_do_not_start_background_services(flask_app):
+    flask_app.config['RETENTION_INTERVAL_HOURS'] = 6
+    config = tracker.worker_config()
+    assert config['RETENTION_INTERVAL_HOURS'] is None
+    assert config['DATABASE'] == flask_app.config['DATABASE']
+
+
+def test_fleet_report_counts_the_stored_charges(flask_app, tmp_path):
+    from benchmarks.generate import generate_fleet_csv
+    path = tmp_path / 'fleet.csv'
+    generate_fleet_csv(str(path), 30_000, 3, seed=5)
+    tracker.import_csv(str(path))
+    conn = tracker.get_db()
+    with conn:
+        conn.executemany('INSERT INTO device_info (device, region, branch) VALUES (?, ?, ?)',
+                         [(f'DEV00000{n}', 'North', 'A') for n in range(3)])
+    lo, hi = conn.execute('SELECT MIN(tracking_date), MAX(tracking_date) FROM gps_data').fetchone()
+    rows = conn.execute('SELECT COUNT(*) FROM gps_data').fetchone()[0]
+    tracker.run_retention(now=hi, raw_days=(hi - lo) // 86400 // 2, hourly_days=None)
+
+    report = tracker.analyze_fleet(lo, hi, region='North', workers=2)
+    assert report['devices'] == report['devices_reporting'] == 3
+    assert sum(r['rows'] for r in report['device_results']) == rows
+    with flask_app.test_request_context():
+        for r in report['device_results']:
+            charges = tracker.load_charge_events(conn, r['device'], lo, hi)
+            assert r['charges'] == len(charges) > 0
+            assert r['long_offline'] == sum(1 for c in charges if c['is_long_offline'])
@@ -0,0 +1,163 @@
+"""Streaming CSV import."""
+
+import io
+import os
+
+import pytest
+
+import app as tracker
+from benchmarks.generate import generate_fleet_csv
+
+
+@pytest.fixture
+def fleet_csv(tmp_path):
+    path = tmp_path / 'fleet.csv'
+    generate_fleet_csv(str(path), 20_000, 4, seed=1)
+    return str(path)
+
+
+def _charge_events(conn):
+    return conn.execute('SELECT * FROM charge_events ORDER BY device, start_time').fetchall()
+
+
+def test_interrupted_import_keeps_derived_tables_in_step(flask_app, fleet_csv):
+    flask_app.config.update(IMPORT_CHUNK_SIZE=2_000, IMPORT_COMMIT_ROWS=4_000)
+
+    def dies_midway(chunks):
+        for n, chunk in enumerate(chunks):
+            if n == 5:
+                raise RuntimeError('worker killed')
+            yield chunk
+
+    with pytest.raises(RuntimeError):
+        tracker.write_gps_chunks(dies_midway(tracker._read_gps_chunks(fleet_csv, chunksize=2_000)))
+    conn = tracker.get_db()
+    conn.rollback()
+    committed = conn.execute('SELECT COUNT(*) FROM gps_data').fetchone()[0]
+    assert 0 < committed < 20_000
+    assert conn.execute('SELECT COUNT(*) FROM data_versions').fetchone()[0] > 0
+
+    totals = tracker.import_csv(fleet_csv, chunksize=2_000)
+    assert totals['rows_written'] + totals['rows_duplicate'] == totals['rows_read'] - totals['rows_dropped']
+    assert conn.execute('SELECT COUNT(*) FROM gps_data').fetchone()[0] == totals['rows_read'] - totals['rows_dropped']
+
+    events = _charge_events(conn)
+    tracker.rebuild_charge_events(conn)
+    assert _charge_events(conn) == events
+
+
+def test_reimport_is_idempotent(flask_app, fleet_csv):
+    first = tracker.import_csv(fleet_csv)
+    second = tracker.import_csv(fleet_csv)
+    assert second['rows_written'] == 0
+    assert second['rows_duplicate'] == first['rows_written']
+
+
+def test_batch_import_matches_single_file_imports(flask_app, tmp_path, fleet_csv):
+    import pandas as pd
+    raw = pd.read_csv(fleet_csv)
+    parts = []
+    for n, start in enumerate(range(0, len(raw), 7_000)):
+        part = tmp_path / f'part{n}.csv'
+        raw.iloc[start:start + 7_000].to_csv(part, index=False)
+        parts.append(str(part))
+
+    flask_app.config['IMPORT_CHUNK_SIZE'] = 3_000
+    totals = tracker.import_csv_batch(parts, workers=2)
+    assert totals['files'] == 3
+    assert totals['rows_written'] == len(raw)
+    # spooled chunks are cleaned up with the batch
+    assert not [name for name in os.listdir(flask_app.config['UPLOAD_FOLDER']) if name != 'jobs']
+
+    conn = tracker.get_db()
+    events = _charge_events(conn)
+    tracker.rebuild_charge_events(conn)
+    assert _charge_events(conn) == events
+
+
+def test_failed_upload_removes_saved_files(flask_app):
+    response = flask_app.test_client().post('/tracker/upload', data={
+        'file': (io.BytesIO(b'not a zip archive'), 'exports.zip'),
+    })
+    assert response.status_code == 400
+    assert not [name for name in os.listdir(flask_app.config['UPLOAD_FOLDER']) if name != 'jobs']
+
+
+def test_device_status_counts_pings_like_the_tracker(flask_app, fleet_csv):
+    tracker.import_csv(fleet_csv)
+    conn = tracker.get_db()
+    status = dict(conn.execute('SELECT device, ping_count FROM device_status'))
+    assert len(status) == 4
+    for device, ping_count in status.items():
+        assert ping_count == int(tracker.load_daily_pings(conn, device, 0, 2 ** 40).sum())
+
+    tracker.rebuild_device_status(conn)
+    assert dict(conn.execute('SELECT device, ping_count FROM device_status')) == status
+
+
+def test_voltages_are_stored_at_full_precision(flask_app, tmp_path):
+    path = tmp_path / 'precise.csv'
+    path.write_text(
+        'Sl. No,Device ID,Event Type,Tracking Date Time,Battery Voltage\n'
+        '1,DEV1,G_PING,01/01/2024 12:00:00 AM,3.123456789\n'
+        '2,DEV1,G_PING,01/01/2024 12:10:00 AM,4.1\n'
+    )
+    tracker.import_csv(str(path))
+    stored = [v for (v,) in tracker.get_db().execute('SELECT battery_voltage FROM gps_data ORDER BY sl_no')]
+    assert stored == [3.123456789, 4.1]
+
+
+def test_concurrent_imports_all_commit(flask_app, tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    paths = []
+    for n in range(4):
+        path = tmp_path / f'exports{n}.csv'
+        generate_fleet_csv(str(path), 20_000, 4, start=f'2024-0{n + 1}-01', seed=n)
+        paths.append(str(path))
+    flask_app.config.update(IMPORT_CHUNK_SIZE=2_000, IMPORT_COMMIT_ROWS=4_000)
+
+    def run(path):
+        with flask_app.app_context():
+            try:
+                return tracker.import_csv(path)
+            finally:
+                tracker.close_db()
+
+    with ThreadPoolExecutor(max_workers=len(paths)) as pool:
+        totals = list(pool.map(run, paths))
+    conn = tracker.get_db()
+    assert conn.execute('SELECT COUNT(*) FROM gps_data').fetchone()[0] == sum(t['rows_written'] for t in totals)
+    assert sum(t['rows_written'] + t['rows_duplicate'] for t in totals) == 80_000
+
+
+def test_simultaneous_upload_jobs_all_finish(flask_app, tmp_path):
+    client = flask_app.test_client()
+    jobs = []
+    for n in range(4):
+        path = tmp_path / f'upload{n}.csv'
+        generate_fleet_csv(str(path), 5_000, 2, start=f'2024-0{n + 1}-01', seed=n)
+        response = client.post('/tracker/upload', data={'file': (open(path, 'rb'), f'upload{n}.csv')})
+        assert response.status_code == 302
+        jobs.append(response.headers['Location'].rsplit('job=', 1)[1])
+    flask_app.extensions['ingest_executor'].shutdown(wait=True)
+
+    assert [tracker.load_job(job)['phase'] for job in jobs] == ['done'] * 4
+    assert tracker.get_db().execute('SELECT COUNT(*) FROM gps_data').fetchone()[0] == 20_000
+
+
+def test_blank_timestamps_are_dropped_not_sampled(flask_app, tmp_path):
+    import json
+    path = tmp_path / 'blanks.csv'
+    path.write_text(
+        'Sl. No,Device ID,Event Type,Tracking Date Time,Battery Voltage\n'
+        '1,DEV1,G_PING,01/01/2024 12:00:00 AM,4.0\n'
+        '2,DEV1,G_PING,,4.0\n'
+        '3,DEV1,G_PING,  ,4.0\n'
+        '4,DEV1,G_PING,not a date,4.0\n'
+    )
+    totals = tracker.import_csv(str(path))
+    assert totals['rows_written'] == 1
+    assert totals['rows_dropped'] == 3
+    assert totals['rows_bad_timestamp'] == 1
+    assert totals['bad_timestamp_samples'] == ['not a date']
+    json.dumps(totals, allow_nan=False)
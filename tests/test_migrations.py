@@ -0,0 +1,84 @@
+"""Upgrading databases written by the original (unversioned) app."""
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import app as tracker
+
+
+def _baseline_db(path, rows, copies=2):
+    """The original schema: TEXT tracking_date, no keys, every upload appended again."""
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE device_info (device TEXT PRIMARY KEY, region TEXT, branch TEXT, sim_type TEXT)')
+    conn.execute('''
+        CREATE TABLE gps_data (
+            sl_no INTEGER, device TEXT, event TEXT, tracking_date TEXT, battery_voltage REAL
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_device ON gps_data(device)')
+    conn.execute('CREATE INDEX idx_date ON gps_data(tracking_date)')
+    for _ in range(copies):
+        conn.executemany('INSERT INTO gps_data VALUES (?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+
+def _rows(devices=3, n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for d in range(devices):
+        times = pd.Timestamp('2024-01-01') + pd.to_timedelta(np.cumsum(rng.integers(60, 1800, n)), unit='s')
+        # sawtooth with a charge roughly every 60 rows
+        voltage = np.round(3.6 + 0.5 * ((np.arange(n) % 60) < 6) * (np.arange(n) % 6) / 5, 2)
+        events = rng.choice(['G_PING', 'REBOOT', 'IGN_ON'], n, p=[0.8, 0.1, 0.1])
+        for i in range(n):
+            rows.append((i + 1, f'DEV{d}', events[i], times[i].strftime('%Y-%m-%d %H:%M:%S'), float(voltage[i])))
+    return rows
+
+
+def test_baseline_with_duplicates_migrates_to_current(flask_app):
+    rows = _rows()
+    _baseline_db(flask_app.config['DATABASE'], rows)
+
+    tracker.create_tables()
+    conn = tracker.get_db()
+
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == tracker.SCHEMA_VERSION
+    assert conn.execute('SELECT COUNT(*) FROM gps_data').fetchone()[0] == len(rows)
+    assert conn.execute("SELECT typeof(tracking_date) FROM gps_data GROUP BY 1").fetchall() == [('integer',)]
+
+    pings = sum(1 for row in rows if row[2] in tracker.PING_EVENTS)
+    assert conn.execute('SELECT SUM(count) FROM daily_ping_counts WHERE event IN (?, ?)',
+                        tracker.PING_EVENTS).fetchone()[0] == pings
+    assert conn.execute('SELECT COUNT(*) FROM device_status').fetchone()[0] == 3
+
+    events = conn.execute('SELECT * FROM charge_events ORDER BY device, start_time').fetchall()
+    assert events
+    tracker.rebuild_charge_events(conn)
+    assert conn.execute('SELECT * FROM charge_events ORDER BY device, start_time').fetchall() == events
+
+
+def test_current_schema_is_idempotent(flask_app):
+    tracker.create_tables()
+    tracker.create_tables()
+    conn = tracker.get_db()
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == tracker.SCHEMA_VERSION
+
+
+def test_baseline_migrates_with_the_parquet_backend(flask_app):
+    flask_app.config['STORAGE_BACKEND'] = 'parquet'
+    rows = _rows()
+    _baseline_db(flask_app.config['DATABASE'], rows, copies=1)
+
+    tracker.create_tables()
+    conn = tracker.get_db()
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == tracker.SCHEMA_VERSION
+    # charge events come from the gps_data ledger, not the (not yet backfilled) Parquet store
+    events = conn.execute('SELECT * FROM charge_events ORDER BY device, start_time').fetchall()
+    assert events
+
+    flask_app.config['STORAGE_BACKEND'] = 'sqlite'
+    tracker.rebuild_charge_events(conn)
+    assert conn.execute('SELECT * FROM charge_events ORDER BY device, start_time').fetchall() == events
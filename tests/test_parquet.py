@@ -0,0 +1,51 @@
+"""Parquet storage backend."""
+
+import pytest
+
+import app as tracker
+from benchmarks.generate import generate_fleet_csv
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def parquet_app(flask_app, tmp_path):
+    path = tmp_path / 'fleet.csv'
+    generate_fleet_csv(str(path), 20_000, 6, seed=2)
+    flask_app.config.update(STORAGE_BACKEND='parquet', PARQUET_DEVICE_BUCKETS=4)
+    tracker.import_csv(str(path), chunksize=2_000)
+    return flask_app
+
+
+def test_import_leaves_one_file_per_partition(parquet_app):
+    conn = tracker.get_db()
+    files_per_partition = {count for (count,) in conn.execute(
+        "SELECT COUNT(*) FROM parquet_files GROUP BY month, bucket"
+    )}
+    assert files_per_partition == {1}
+    assert conn.execute("SELECT SUM(rows) FROM parquet_files").fetchone()[0] == \
+        conn.execute("SELECT COUNT(*) FROM gps_data").fetchone()[0]
+
+
+def test_reads_match_sqlite(parquet_app):
+    conn = tracker.get_db()
+    devices = [d for (d,) in conn.execute("SELECT DISTINCT device FROM gps_data ORDER BY device")]
+    parquet = {d: tracker.read_gps_rows(conn, d) for d in devices}
+    parquet_app.config['STORAGE_BACKEND'] = 'sqlite'
+    for device in devices:
+        sqlite = tracker.read_gps_rows(conn, device)
+        assert parquet[device]['tracking_date'].tolist() == sqlite['tracking_date'].tolist()
+        assert parquet[device]['battery_voltage'].tolist() == sqlite['battery_voltage'].tolist()
+
+
+def test_reads_stop_at_the_retention_horizon(parquet_app):
+    conn = tracker.get_db()
+    device = conn.execute("SELECT MIN(device) FROM gps_data").fetchone()[0]
+    lo, hi = conn.execute("SELECT MIN(tracking_date), MAX(tracking_date) FROM gps_data").fetchone()
+    tracker.run_retention(now=hi, raw_days=(hi - lo) // 86400 // 2, hourly_days=None)
+
+    horizon = tracker.raw_horizon(conn)
+    parquet = tracker.read_gps_rows(conn, device)
+    assert tracker.epoch_seconds(parquet['tracking_date'].min()) >= horizon
+    parquet_app.config['STORAGE_BACKEND'] = 'sqlite'
+    assert len(parquet) == len(tracker.read_gps_rows(conn, device))
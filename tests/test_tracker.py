@@ -0,0 +1,47 @@
+"""/tracker and /tracker/compare results."""
+
+import pytest
+
+import app as tracker
+from benchmarks.generate import generate_fleet_csv
+
+
+@pytest.fixture
+def rolled_fleet(flask_app, tmp_path):
+    """Three devices, with the older half of their history rolled up by retention."""
+    path = tmp_path / 'fleet.csv'
+    generate_fleet_csv(str(path), 30_000, 3, seed=5)
+    tracker.import_csv(str(path))
+    conn = tracker.get_db()
+    lo, hi = conn.execute('SELECT MIN(tracking_date), MAX(tracking_date) FROM gps_data').fetchone()
+    tracker.run_retention(now=hi, raw_days=(hi - lo) // 86400 // 2, hourly_days=None)
+    return lo, hi
+
+
+def test_compare_agrees_with_tracker_after_retention(flask_app, rolled_fleet):
+    lo, hi = rolled_fleet
+    devices = ['DEV000000', 'DEV000001', 'DEV000002']
+    with flask_app.test_request_context():
+        rows, chart = tracker.compare_result(devices, lo, hi)
+        assert chart
+        for row in rows:
+            result, _ = tracker.tracker_result(row['device'], lo, hi)
+            assert row['charges'] == result['charges'] > 0
+            assert row['pings'] == result['pings']
+            assert row['rows'] == len(tracker.read_voltage_history(tracker.get_db(), row['device'], lo, hi))
+
+
+@pytest.mark.parametrize('points, budget', [(None, 500), (0, 500), (-5, 500), (100, 100), (10 ** 9, 500)])
+def test_points_override_is_clamped(flask_app, rolled_fleet, monkeypatch, points, budget):
+    flask_app.config['CHART_MAX_POINTS'] = 500
+    seen = []
+    downsample = tracker.downsample_voltage
+    monkeypatch.setattr(tracker, 'downsample_voltage',
+                        lambda df, max_points, *args, **kwargs: seen.append(max_points) or
+                        downsample(df, max_points, *args, **kwargs))
+
+    query = {'device': 'DEV000000', 'from_date': '01-01-2024', 'to_date': '31-12-2024'}
+    if points is not None:
+        query['points'] = points
+    assert flask_app.test_client().get('/tracker', query_string=query).status_code == 200
+    assert seen == [budget]